@@ -3,7 +3,7 @@ from httpx import AsyncClient
 from sqlmodel import Session, SQLModel, create_engine
 
 from app.core.config import settings
-from app.db.init_db import init_db
+from app.db.init_db import init_db, upgrade_db
 from app.web.api.deps import get_db
 from app.web.application import get_app
 
@@ -15,6 +15,7 @@ def engine_fixture():
     )
     SQLModel.metadata.create_all(engine)
     with Session(engine) as session:
+        upgrade_db(session)
         init_db(session)
     yield engine
 
@@ -64,9 +64,85 @@ class Settings(BaseSettings):
     EMAIL_TEMPLATES_DIR: str = "/app/app/email-templates/"
 
     # requests settings
-    REQUESTS_BATCH_SIZE: int = 2
+    # requests in flight per task, in total and per host
+    REQUESTS_CONCURRENCY: int = 32
+    REQUESTS_PER_HOST_CONCURRENCY: int = 8
+    # idle connections kept alive for reuse
+    REQUESTS_KEEPALIVE: int = 16
+    # seconds allowed for one request and for a whole batch of a task
+    REQUESTS_TIMEOUT: float = 30.0
+    REQUESTS_BATCH_TIMEOUT: float = 600.0
+    # retries of failed requests, with jittered exponential backoff
+    REQUESTS_RETRIES: int = 3
+    REQUESTS_BACKOFF: float = 1.0
+    REQUESTS_BACKOFF_MAX: float = 60.0
+    # consecutive failures that open the circuit of a host, and its cool-down
+    BREAKER_THRESHOLD: int = 5
+    BREAKER_COOLDOWN: float = 300.0
+    # conditional request validators, empty directory disables the cache
+    HTTP_CACHE_DIR: str = "/var/cache/bemore/http"
+    HTTP_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # raw page archive for offline re-parsing, empty directory disables it
+    ARCHIVE_DIR: str = "/var/lib/bemore/archive"
+    ARCHIVE_ZSTD_LEVEL: int = 10
+    # archived pages re-parsed per task
+    REPARSE_SHARD_SIZE: int = 500
+    # rows written per upsert transaction
+    SAVE_BATCH_SIZE: int = 500
+    # pages a crawl task fetches, parses and commits together, and the age
+    # after which the checkpoint of an unfinished task is dropped
+    CRAWL_FLUSH_SIZE: int = 100
+    CRAWL_CHECKPOINT_TTL: int = 60 * 60 * 24 * 2
+    # estimated jaccard similarity above which papers are merged
+    DEDUP_THRESHOLD: float = 0.8
+    # requests per second and burst size per source, across all workers
+    CRAWL_RATE: float = 0.5
+    CRAWL_BURST: int = 10
+    # crawl fan-out: target wall time of one task and bounds of its url chunk
+    CRAWL_TASK_SECONDS: int = 300
+    CRAWL_MIN_CHUNK: int = 10
+    CRAWL_MAX_CHUNK: int = 1000
+    # seconds per url assumed before any task of a source has finished
+    CRAWL_DEFAULT_LATENCY: float = 2.0
+    CRAWL_LATENCY_SMOOTHING: float = 0.3
+    # crawl frontier: revisit interval of new urls and its adaptive bounds
     CRAWL_INTERVAL: int = 60 * 60 * 24 * 7  # 1 week
+    CRAWL_MIN_INTERVAL: int = 60 * 60  # 1 hour
+    CRAWL_MAX_INTERVAL: int = 60 * 60 * 24 * 30  # 30 days
+    # seconds between scheduler runs, and due urls taken per source and run
+    CRAWL_SCHEDULE_INTERVAL: int = 60 * 10
+    CRAWL_DUE_LIMIT: int = 5000
+    # seconds before urls taken but not crawled are due again
+    CRAWL_LEASE: int = 60 * 60 * 6
     DATA_SIZE: int = 100
+    # training documents ranked to evaluate doc2vec, all of them if 0
+    DOC2VEC_EVAL_SAMPLE: int = 0
+    # trained doc2vec models, items embedded per inference transaction and
+    # per parallel inference task
+    MODEL_DIR: str = "/var/lib/bemore/models"
+    EMBED_BATCH_SIZE: int = 1000
+    EMBED_SHARD_SIZE: int = 20000
+    # tokenized abstracts, merged once they span more segments
+    TOKEN_CACHE_DIR: str = "/var/lib/bemore/tokens"
+    TOKEN_CACHE_SEGMENTS: int = 8
+    # item vectors mapped by the api and the workers, float32 or float16
+    EMBEDDING_DIR: str = "/var/lib/bemore/embeddings"
+    EMBEDDING_DTYPE: str = "float32"
+    # nearest-neighbour index of the item vectors: lists scored per query,
+    # vectors the centroids are trained on, and the share of rows added
+    # since the last build before they are merged into the lists
+    ANN_INDEX_DIR: str = "/var/lib/bemore/ann"
+    ANN_PROBES: int = 32
+    ANN_TRAIN_SAMPLE: int = 100000
+    ANN_TAIL_FRACTION: float = 0.1
+    # items ranked per search query before filtering, inference epochs of
+    # a query, a few words need more than an abstract, and queries cached
+    # per api process
+    SEARCH_CANDIDATES: int = 500
+    SEARCH_EPOCHS: int = 200
+    SEARCH_CACHE_SIZE: int = 1024
+    # port of the Prometheus exporter of the celery worker, 0 disables it
+    METRICS_PORT: int = 9808
 
     model_config = SettingsConfigDict(
         env_file=".env",
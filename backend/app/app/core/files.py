@@ -0,0 +1,45 @@
+import fcntl
+import os
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from pathlib import Path
+from typing import IO
+
+
+@contextmanager
+def file_lock(root: Path, mode: int) -> Iterator[None]:
+    """
+    Hold ``flock`` on the ``LOCK`` file of a directory, shared by every
+    process of the host.
+
+    :param root: directory, created if missing.
+    :param mode: ``fcntl.LOCK_SH`` or ``fcntl.LOCK_EX``.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / "LOCK", "a") as f:
+        fcntl.flock(f, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def replacing(path: Path, mode: str = "w") -> Iterator[IO]:
+    """
+    Write a file next to ``path`` and move it over ``path`` once complete,
+    readers see the old file or the new one, never a partial one.
+
+    :param path: file to replace.
+    :param mode: ``"w"`` for text, ``"wb"`` for bytes.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp)
+        raise
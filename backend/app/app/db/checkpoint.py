@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col
+
+from app.models import CrawlCheckpoint
+
+BACKFILL_PREFIX = "backfill:"
+
+
+def backfill_key(source: str, year: int) -> str:
+    """
+    Checkpoint key of the backfill of a source for a year.
+    """
+    return f"{BACKFILL_PREFIX}{source}:{year}"
+
+
+def load_checkpoint(session: Session, key: Optional[str]) -> int:
+    """
+    Units of work a task already committed, 0 if it has no checkpoint.
+
+    :param session: database session.
+    :param key: checkpoint key, None disables checkpointing.
+    """
+    if key is None:
+        return 0
+    checkpoint = session.get(CrawlCheckpoint, key)
+    return 0 if checkpoint is None else checkpoint.offset
+
+
+def checkpoint_done(session: Session, key: Optional[str]) -> bool:
+    """
+    Whether the work of a checkpoint is complete.
+    """
+    if key is None:
+        return False
+    checkpoint = session.get(CrawlCheckpoint, key)
+    return checkpoint is not None and checkpoint.done
+
+
+def save_checkpoint(
+    session: Session, key: Optional[str], offset: int, done: bool = False
+) -> None:
+    """
+    Record progress in the caller's transaction, so it commits together
+    with the work it covers.
+
+    :param session: database session.
+    :param key: checkpoint key, None disables checkpointing.
+    :param offset: units of work committed so far.
+    :param done: the work is complete, the checkpoint is kept as a marker.
+    """
+    if key is None:
+        return
+    table = CrawlCheckpoint.__table__  # type: ignore
+    stmt = insert(table).values(
+        key=key, offset=offset, done=done, updated_at=datetime.utcnow()
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                "offset": stmt.excluded.offset,
+                "done": stmt.excluded.done,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+    )
+
+
+def clear_checkpoint(session: Session, key: Optional[str]) -> None:
+    if key is not None:
+        session.execute(
+            delete(CrawlCheckpoint).where(CrawlCheckpoint.key == key)
+        )
+
+
+def clear_backfill(session: Session, source: str, years: range) -> None:
+    """
+    Forget the progress of the backfill of a source, so it starts over.
+    """
+    keys = [backfill_key(source, year) for year in years]
+    session.execute(
+        delete(CrawlCheckpoint).where(col(CrawlCheckpoint.key).in_(keys))
+    )
+
+
+def clear_stale_checkpoints(session: Session, age: int) -> None:
+    """
+    Drop checkpoints of tasks that were not resumed within ``age`` seconds.
+
+    Backfill checkpoints are kept, they are resumed by hand.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=age)
+    session.execute(
+        delete(CrawlCheckpoint).where(
+            CrawlCheckpoint.updated_at < cutoff,
+            col(CrawlCheckpoint.key).not_like(f"{BACKFILL_PREFIX}%"),
+        )
+    )
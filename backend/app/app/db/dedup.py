@@ -0,0 +1,318 @@
+import hashlib
+import re
+import unicodedata
+import zlib
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.models import ItemBand
+
+# signature length and banding: 16 bands of 8 rows put the LSH threshold
+# near a jaccard similarity of (1 / 16) ** (1 / 8) ~ 0.7
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+_PRIME = np.uint64((1 << 61) - 1)
+_MASK = np.uint64(0xFFFFFFFF)
+# the permutations must be the same in every process and across releases
+_rng = np.random.default_rng(20231101)
+_A = _rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+
+CANDIDATES = text(
+    """
+    SELECT b.band, b.hash, i.title, i.minhash
+    FROM itemband b JOIN item i ON i.id = b.item_id
+    WHERE (b.band, b.hash) IN (
+        SELECT * FROM unnest(CAST(:bands AS int[]), CAST(:hashes AS bigint[]))
+    )
+    """
+)
+SET_MINHASH = text(
+    """
+    UPDATE item SET minhash = v.minhash
+    FROM unnest(CAST(:titles AS text[]), CAST(:minhashes AS bytea[]))
+        AS v(title, minhash)
+    WHERE item.title = v.title AND item.minhash IS NULL
+    RETURNING item.id, item.minhash
+    """
+)
+UNINDEXED = text(
+    "SELECT id, title, abstract FROM item WHERE minhash IS NULL ORDER BY id"
+)
+# items sharing at least one band, each pair once
+CANDIDATE_PAIRS = text(
+    """
+    SELECT DISTINCT a.item_id, b.item_id
+    FROM itemband a JOIN itemband b
+        ON a.band = b.band AND a.hash = b.hash AND a.item_id < b.item_id
+    """
+)
+
+
+def shingles(title: str, abstract: Optional[str]) -> set[str]:
+    """
+    Word shingles of the normalized title and abstract.
+    """
+    normalized = unicodedata.normalize("NFKD", f"{title} {abstract or ''}")
+    words = re.findall(r"[a-z0-9]+", normalized.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(title: str, abstract: Optional[str]) -> Optional[np.ndarray]:
+    """
+    MinHash signature of a paper, None if it has no words.
+    """
+    tokens = shingles(title, abstract)
+    if not tokens:
+        return None
+    x = np.fromiter(
+        (zlib.crc32(token.encode()) for token in tokens),
+        dtype=np.uint64,
+        count=len(tokens),
+    )
+    hashes = ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME) & _MASK
+    return hashes.min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Estimated jaccard similarity of two signatures.
+    """
+    return float(np.mean(a == b))
+
+
+def bands(signature: np.ndarray) -> list[tuple[int, int]]:
+    """
+    LSH bucket of every band of a signature.
+    """
+    return [
+        (
+            band,
+            int.from_bytes(
+                hashlib.blake2b(
+                    signature[band * ROWS : (band + 1) * ROWS].tobytes(),
+                    digest_size=8,
+                ).digest(),
+                "big",
+                signed=True,
+            ),
+        )
+        for band in range(BANDS)
+    ]
+
+
+def _signature(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint32)
+
+
+def merge_near_duplicates(
+    session: Session, rows: list[dict]
+) -> list[Optional[np.ndarray]]:
+    """
+    Point near-duplicate papers at their canonical item.
+
+    The title of a row whose signature is close enough to an indexed item,
+    or to an earlier row of the batch, is replaced by the title of that
+    item, so the upsert updates it instead of inserting a duplicate.
+
+    :param session: database session.
+    :param rows: parsed papers, titles are rewritten in place.
+    :returns: signature of every row.
+    """
+    signatures = [minhash(row["title"], row.get("abstract")) for row in rows]
+    keys = {
+        key: None
+        for signature in signatures
+        if signature is not None
+        for key in bands(signature)
+    }
+    if not keys:
+        return signatures
+
+    # indexed items sharing a band with the batch, one round trip
+    candidates: dict[tuple[int, int], list[tuple[str, np.ndarray]]] = {}
+    found = session.execute(
+        CANDIDATES,
+        {
+            "bands": [band for band, _ in keys],
+            "hashes": [hash_ for _, hash_ in keys],
+        },
+    )
+    for band, hash_, title, data in found:
+        candidates.setdefault((band, hash_), []).append(
+            (title, _signature(data))
+        )
+
+    for row, signature in zip(rows, signatures):
+        if signature is None:
+            continue
+        best, best_title = settings.DEDUP_THRESHOLD, None
+        for key in bands(signature):
+            for title, other in candidates.get(key, []):
+                score = similarity(signature, other)
+                if title != row["title"] and score >= best:
+                    best, best_title = score, title
+        if best_title is not None:
+            row["title"] = best_title
+        # later rows of the batch may duplicate this one
+        for key in bands(signature):
+            candidates.setdefault(key, []).append((row["title"], signature))
+    return signatures
+
+
+def index_items(
+    session: Session,
+    rows: list[dict],
+    signatures: list[Optional[np.ndarray]],
+) -> None:
+    """
+    Store signatures and LSH buckets of items that have none yet.
+
+    :param session: database session.
+    :param rows: saved papers.
+    :param signatures: signature of every row, see ``merge_near_duplicates``.
+    """
+    unindexed = {
+        row["title"]: signature.tobytes()
+        for row, signature in zip(rows, signatures)
+        if signature is not None
+    }
+    if not unindexed:
+        return
+    indexed = session.execute(
+        SET_MINHASH,
+        {
+            "titles": list(unindexed),
+            "minhashes": list(unindexed.values()),
+        },
+    ).all()
+    _insert_bands(session, indexed)
+
+
+def _insert_bands(session: Session, items: list[tuple[int, bytes]]) -> None:
+    # bands of an earlier signature of the items go first
+    session.execute(
+        text("DELETE FROM itemband WHERE item_id = ANY(:ids)"),
+        {"ids": [item_id for item_id, _ in items]},
+    )
+    params = [
+        {"item_id": item_id, "band": band, "hash": hash_}
+        for item_id, data in items
+        for band, hash_ in bands(_signature(data))
+    ]
+    if params:
+        session.execute(
+            insert(ItemBand.__table__).on_conflict_do_nothing(),  # type: ignore
+            params,
+        )
+
+
+def index_catalog(session: Session, yield_per: int = 1000) -> int:
+    """
+    Sign and index every item without a signature.
+
+    :returns: number of indexed items.
+    """
+    # signatures are written while reading, on a second connection
+    count = 0
+    batch: list[tuple[int, bytes]] = []
+    with Session(session.get_bind()) as reader:
+        rows = reader.execute(
+            UNINDEXED, execution_options={"yield_per": yield_per}
+        )
+        for item_id, title, abstract in rows:
+            signature = minhash(title, abstract)
+            if signature is None:
+                continue
+            batch.append((item_id, signature.tobytes()))
+            if len(batch) == yield_per:
+                count += _write_signatures(session, batch)
+                batch = []
+    return count + _write_signatures(session, batch)
+
+
+def _write_signatures(session: Session, items: list[tuple[int, bytes]]) -> int:
+    if items:
+        session.execute(
+            text("UPDATE item SET minhash = :minhash WHERE id = :id"),
+            [{"id": item_id, "minhash": data} for item_id, data in items],
+        )
+        _insert_bands(session, items)
+    return len(items)
+
+
+def duplicate_groups(session: Session) -> dict[int, int]:
+    """
+    Near-duplicate items of the catalog mapped to their canonical item.
+
+    Candidate pairs come from the LSH buckets and are kept when their
+    signatures are similar enough. Connected items form a group whose
+    oldest item is canonical.
+    """
+    parent: dict[int, int] = {}
+
+    def find(item_id: int) -> int:
+        while parent.get(item_id, item_id) != item_id:
+            item_id = parent[item_id]
+        return item_id
+
+    pairs = session.execute(CANDIDATE_PAIRS).all()
+    ids = {item_id for pair in pairs for item_id in pair}
+    signatures = {
+        item_id: _signature(data)
+        for item_id, data in session.execute(
+            text("SELECT id, minhash FROM item WHERE id = ANY(:ids)"),
+            {"ids": list(ids)},
+        )
+    }
+    for a, b in pairs:
+        if similarity(signatures[a], signatures[b]) >= settings.DEDUP_THRESHOLD:
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+    return {item_id: find(item_id) for item_id in parent}
+
+
+def merge_items(session: Session, canonical: dict[int, int]) -> None:
+    """
+    Fold duplicate items into their canonical item.
+
+    Feedback moves to the canonical item, the duplicates are deleted.
+
+    :param canonical: duplicate item id to canonical item id.
+    """
+    if not canonical:
+        return
+    params = {
+        "duplicates": list(canonical),
+        "canonicals": list(canonical.values()),
+    }
+    mapping = (
+        "unnest(CAST(:duplicates AS int[]), CAST(:canonicals AS int[]))"
+        " AS m(duplicate, canonical)"
+    )
+    session.execute(
+        text(
+            f"UPDATE feedback SET item_id = m.canonical FROM {mapping}"
+            " WHERE feedback.item_id = m.duplicate"
+        ),
+        params,
+    )
+    session.execute(
+        text("DELETE FROM itemband WHERE item_id = ANY(:duplicates)"), params
+    )
+    session.execute(
+        text("DELETE FROM item WHERE id = ANY(:duplicates)"), params
+    )
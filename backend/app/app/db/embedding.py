@@ -0,0 +1,175 @@
+from typing import Optional
+
+import numpy as np
+from gensim.models.doc2vec import Doc2Vec
+from sqlmodel import Session, text
+
+from app.ml.doc2vec import tokenize
+from app.ml.tokens import TokenCache
+from app.ml.vectors import EmbeddingStore
+from app.models import EMBEDDING_STALE
+
+# items never embedded, embedded by another model, or whose content changed
+STALE = f"""
+    {EMBEDDING_STALE}
+    OR embedding_version IS NULL
+    OR embedding_version < :version
+    OR embedding_version > :version
+"""
+# the same items, each half served by an index of ``Item``, so the few
+# items of a crawl are found without reading the whole catalog
+STALE_IDS = f"""
+    SELECT id FROM item WHERE {EMBEDDING_STALE}
+    UNION
+    SELECT id FROM item
+    WHERE embedding_version IS NULL
+        OR embedding_version < :version
+        OR embedding_version > :version
+"""
+# the next stale items of a range, locked until their vectors are committed,
+# items locked by another inference are left to it
+CLAIM_STALE = text(
+    f"""
+    SELECT id, decode(md5(abstract), 'hex'), content_hash FROM item
+    WHERE id > :after AND id <= :last AND ({STALE})
+    ORDER BY id
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+    """
+)
+# id range of every run of ``size`` stale items
+STALE_SHARDS = text(
+    f"""
+    SELECT min(id), max(id) FROM (
+        SELECT id, (row_number() OVER (ORDER BY id) - 1) / :size AS shard
+        FROM ({STALE_IDS}) stale
+    ) s
+    GROUP BY shard ORDER BY 1
+    """
+)
+ANY_STALE = text(f"SELECT EXISTS ({STALE_IDS})")
+# one inference planned at a time, held until the planning transaction ends
+PLAN_LOCK = text("SELECT pg_try_advisory_xact_lock(:key)")
+PLAN_LOCK_KEY = 0x646F6332  # "doc2"
+SET_EMBEDDINGS = text(
+    """
+    UPDATE item SET
+        doc2vec = v.doc2vec,
+        embedding_version = :version,
+        embedding_hash = v.hash
+    FROM unnest(
+        CAST(:ids AS int[]), CAST(:vectors AS bytea[]), CAST(:hashes AS text[])
+    ) AS v(id, doc2vec, hash)
+    WHERE item.id = v.id
+    """
+)
+
+
+def vector_bytes(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def stale_shards(
+    session: Session, version: str, size: int
+) -> list[tuple[int, int]]:
+    """
+    Split the items waiting for a vector of a model version into id ranges
+    of about ``size`` items each.
+
+    :returns: first and last item id of every shard.
+    """
+    rows = session.execute(STALE_SHARDS, {"version": version, "size": size})
+    return [(first, last) for first, last in rows]
+
+
+def any_stale(session: Session, version: str) -> bool:
+    """
+    Whether some item still waits for a vector of a model version.
+    """
+    return session.execute(ANY_STALE, {"version": version}).scalar()
+
+
+def lock_planning(session: Session) -> bool:
+    """
+    Take the inference planning lock until the end of the transaction.
+
+    :returns: False if another inference is being planned.
+    """
+    return session.execute(PLAN_LOCK, {"key": PLAN_LOCK_KEY}).scalar()
+
+
+def infer_stale(
+    session: Session,
+    model: Doc2Vec,
+    version: str,
+    cache: TokenCache,
+    batch_size: int = 1000,
+    first: int = 0,
+    last: Optional[int] = None,
+    store: Optional[EmbeddingStore] = None,
+) -> int:
+    """
+    Infer the vectors of items that lack a vector of the current model or
+    whose content changed since, committing every ``batch_size`` items.
+
+    Tokens are read from the cache, only items missing from it or changed
+    since it was synced are tokenized here. Every batch is locked until it
+    is committed, shards of overlapping inferences skip each other's items.
+
+    :param session: database session the vectors are written with.
+    :param model: trained doc2vec model.
+    :param version: version of the model.
+    :param cache: loaded token cache.
+    :param batch_size: items read, inferred and written together.
+    :param first: first item id of the shard.
+    :param last: last item id of the shard, no bound if None.
+    :param store: embedding store the vectors are also put in, they are
+        committed once stored.
+    :returns: number of embedded items.
+    """
+    count = 0
+    after = first - 1
+    while batch := session.execute(
+        CLAIM_STALE,
+        {
+            "version": version,
+            "after": after,
+            "last": 2**31 - 1 if last is None else last,
+            "limit": batch_size,
+        },
+    ).all():
+        ids = [item_id for item_id, _, _ in batch]
+        tokens = {
+            item_id: cache.tokens(item_id, bytes(digest))
+            for item_id, digest, _ in batch
+        }
+        missing = [item_id for item_id in ids if tokens[item_id] is None]
+        if missing:
+            tokens.update(
+                (item_id, tokenize(abstract))
+                for item_id, abstract in session.execute(
+                    text("SELECT id, abstract FROM item WHERE id = ANY(:ids)"),
+                    {"ids": missing},
+                )
+            )
+        vectors = np.array(
+            [model.infer_vector(tokens[item_id]) for item_id in ids],
+            dtype=np.float32,
+        )
+        session.execute(
+            SET_EMBEDDINGS,
+            {
+                "ids": ids,
+                "vectors": [vector_bytes(vector) for vector in vectors],
+                "hashes": [content for _, _, content in batch],
+                "version": version,
+            },
+        )
+        # a failed put rolls the batch back, it stays stale and is retried
+        if store is not None:
+            store.put(version, ids, vectors, commit=session.commit)
+        else:
+            session.commit()
+        count += len(batch)
+        after = ids[-1]
+    return count
@@ -0,0 +1,165 @@
+import hashlib
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import Session, text
+
+from app.core.config import settings
+
+# new urls enter the frontier due now, known ones are left as they are
+ADD_URLS = text(
+    """
+    INSERT INTO crawlfrontier
+        (source, url, listing, next_due, revisit_seconds)
+    SELECT DISTINCT :source, c.url, :listing, :now, :revisit
+    FROM candidate_url c
+    ON CONFLICT (source, url) DO NOTHING
+    """
+)
+# due urls, never crawled ones first, leased so the next tick skips them
+LEASE_DUE = text(
+    """
+    UPDATE crawlfrontier f
+    SET next_due = :now + make_interval(secs => :lease)
+    FROM (
+        SELECT source, url FROM crawlfrontier
+        WHERE source = :source AND listing = :listing AND next_due <= :now
+        ORDER BY last_crawled IS NOT NULL, next_due
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ) d
+    WHERE f.source = d.source AND f.url = d.url
+    RETURNING f.url
+    """
+)
+# unchanged pages are revisited half as often, changed ones twice as often
+RECORD_CRAWLS = text(
+    """
+    UPDATE crawlfrontier f SET
+        revisit_seconds = n.revisit_seconds,
+        digest = n.digest,
+        last_crawled = :now,
+        next_due = :now + make_interval(secs => n.revisit_seconds)
+    FROM (
+        SELECT
+            f.url,
+            CASE
+                WHEN f.last_crawled IS NULL THEN f.revisit_seconds
+                WHEN v.digest IS NULL OR v.digest = f.digest
+                    THEN LEAST(:max_revisit, f.revisit_seconds * 2)
+                ELSE GREATEST(:min_revisit, f.revisit_seconds / 2)
+            END AS revisit_seconds,
+            COALESCE(v.digest, f.digest) AS digest
+        FROM crawlfrontier f
+        JOIN unnest(CAST(:urls AS text[]), CAST(:digests AS text[]))
+            AS v(url, digest) ON f.url = v.url
+        WHERE f.source = :source
+    ) n
+    WHERE f.source = :source AND f.url = n.url
+    """
+)
+
+
+def add_urls(
+    session: Session,
+    source: str,
+    urls: Iterable[str],
+    listing: bool = False,
+) -> tuple[int, str]:
+    """
+    Add urls to the frontier of a source, streaming them through COPY.
+
+    The urls are copied into a temporary table that lives until the end of
+    the transaction.
+
+    :param session: database session.
+    :param source: source name.
+    :param urls: urls, duplicates and known urls are allowed.
+    :param listing: whether the urls list the pages of the source.
+    :returns: number of new urls, and a digest of all urls in order.
+    """
+    connection = session.connection()
+    connection.exec_driver_sql(
+        "CREATE TEMPORARY TABLE IF NOT EXISTS candidate_url "
+        "(url text NOT NULL) ON COMMIT DROP"
+    )
+    connection.exec_driver_sql("TRUNCATE candidate_url")
+    digest = hashlib.sha256()
+    cursor = connection.connection.cursor()
+    with cursor.copy("COPY candidate_url (url) FROM STDIN") as copy:
+        for url in urls:
+            digest.update(url.encode() + b"\n")
+            copy.write_row((url,))
+    cursor.close()
+
+    added = connection.execute(
+        ADD_URLS,
+        {
+            "source": source,
+            "listing": listing,
+            "now": datetime.utcnow(),
+            "revisit": settings.CRAWL_INTERVAL,
+        },
+    )
+    return added.rowcount, digest.hexdigest()
+
+
+def lease_due(
+    session: Session,
+    source: str,
+    limit: Optional[int] = None,
+    listing: bool = False,
+) -> list[str]:
+    """
+    Take the due urls of a source, never crawled ones first.
+
+    The urls are not due again before ``CRAWL_LEASE`` seconds, so a crawl
+    that fails without recording them is retried later.
+
+    :param session: database session.
+    :param source: source name.
+    :param limit: maximum number of urls, ``CRAWL_DUE_LIMIT`` if None.
+    :param listing: take listing urls instead of pages.
+    """
+    rows = session.execute(
+        LEASE_DUE,
+        {
+            "source": source,
+            "listing": listing,
+            "now": datetime.utcnow(),
+            "lease": settings.CRAWL_LEASE,
+            "limit": limit or settings.CRAWL_DUE_LIMIT,
+        },
+    )
+    return list(rows.scalars())
+
+
+def record_crawls(
+    session: Session, source: str, digests: dict[str, Optional[str]]
+) -> None:
+    """
+    Schedule the next visit of crawled urls.
+
+    The revisit interval of a url is halved when its content changed and
+    doubled when it did not, within ``CRAWL_MIN_INTERVAL`` and
+    ``CRAWL_MAX_INTERVAL``.
+
+    :param session: database session.
+    :param source: source name.
+    :param digests: digest of the content of every url, None if it was not
+        modified since the last crawl.
+    """
+    if not digests:
+        return
+    session.execute(
+        RECORD_CRAWLS,
+        {
+            "source": source,
+            "urls": list(digests),
+            "digests": list(digests.values()),
+            "now": datetime.utcnow(),
+            "min_revisit": settings.CRAWL_MIN_INTERVAL,
+            "max_revisit": settings.CRAWL_MAX_INTERVAL,
+        },
+    )
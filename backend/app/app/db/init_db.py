@@ -2,11 +2,12 @@ import csv
 import logging
 import random
 
-from sqlmodel import Session, SQLModel, select
+from sqlmodel import Session, SQLModel, select, text
 
 from app.core.config import settings
 from app.db.engine import engine
 from app.models import (
+    EMBEDDING_STALE,
     FeedBack,
     Item,
     User,
@@ -14,6 +15,56 @@ from app.models import (
 )
 
 
+def _has_index(session: Session, name: str) -> bool:
+    return (
+        session.exec(text(f"SELECT to_regclass('{name}')")).one()[0] is not None
+    )
+
+
+def upgrade_db(session: Session) -> None:
+    """
+    Apply schema changes that ``create_all`` does not make to existing tables.
+    """
+    if not _has_index(session, "ix_crawleditem_raw_url"):
+        # keep the most recent row of each url before enforcing uniqueness
+        session.exec(
+            text(
+                "DELETE FROM crawleditem a USING crawleditem b "
+                "WHERE a.raw_url = b.raw_url AND a.id < b.id"
+            )
+        )
+        session.exec(
+            text(
+                "CREATE UNIQUE INDEX ix_crawleditem_raw_url "
+                "ON crawleditem (raw_url)"
+            )
+        )
+    session.exec(
+        text("ALTER TABLE item ADD COLUMN IF NOT EXISTS minhash bytea")
+    )
+    session.exec(
+        text("ALTER TABLE item ADD COLUMN IF NOT EXISTS content_hash varchar")
+    )
+    for column in ("embedding_version", "embedding_hash"):
+        session.exec(
+            text(f"ALTER TABLE item ADD COLUMN IF NOT EXISTS {column} varchar")
+        )
+    session.exec(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_item_embedding_stale ON item (id) "
+            f"WHERE {EMBEDDING_STALE}"
+        )
+    )
+    for column in ("embedding_version", "last_updated"):
+        session.exec(
+            text(
+                f"CREATE INDEX IF NOT EXISTS ix_item_{column} "
+                f"ON item ({column})"
+            )
+        )
+    session.commit()
+
+
 def init_db(session: Session) -> None:
     user = session.exec(
         select(User).where(User.email == settings.FIRST_SUPERUSER),
@@ -64,4 +115,5 @@ def init_db(session: Session) -> None:
 async def init():
     with Session(engine) as session:
         SQLModel.metadata.create_all(engine)
+        upgrade_db(session)
         init_db(session)
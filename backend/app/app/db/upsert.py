@@ -0,0 +1,133 @@
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session
+
+from app.models import CrawledItem, Item
+
+# Item columns refreshed when a known title is ingested again
+ITEM_UPDATE_FIELDS = ("category", "url", "abstract", "authors")
+ITEM_FIELDS = ("title", "keywords", *ITEM_UPDATE_FIELDS)
+
+
+@dataclass
+class UpsertResult:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    def __iadd__(self, other: "UpsertResult") -> "UpsertResult":
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        return self
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip()
+    if isinstance(value, (list, tuple)):
+        return [_normalize(element) for element in value]
+    return value
+
+
+def content_hash(row: dict) -> str:
+    """
+    Digest of the updatable fields of an item, insensitive to whitespace.
+    """
+    normalized = {
+        field: _normalize(row.get(field)) for field in ITEM_UPDATE_FIELDS
+    }
+    data = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def upsert_items(
+    session: Session, rows: list[dict], source: str
+) -> UpsertResult:
+    """
+    Insert items, updating the ones whose title already exists.
+
+    Stored and incoming rows are compared by ``content_hash`` in the same
+    statement, rows whose content did not change are left untouched, so
+    ``last_updated`` only moves on real changes. The MinHash signature of
+    an updated item is cleared, so ``app.db.dedup.index_items`` signs the
+    new content. The statement runs inside the caller's transaction,
+    commit is up to the caller.
+
+    :param session: database session.
+    :param rows: parsed papers, see ``PaperType``.
+    :param source: value stored in ``Item.from_source`` for new rows.
+    :returns: number of inserted, updated and unchanged rows.
+    """
+    # ON CONFLICT cannot touch the same row twice in one statement
+    rows = list({row["title"]: row for row in rows}.values())
+    if not rows:
+        return UpsertResult()
+
+    table = Item.__table__  # type: ignore
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.title],
+        set_={
+            **{field: stmt.excluded[field] for field in ITEM_UPDATE_FIELDS},
+            "content_hash": stmt.excluded.content_hash,
+            "last_updated": stmt.excluded.last_updated,
+            "minhash": None,
+        },
+        where=table.c.content_hash.is_distinct_from(stmt.excluded.content_hash),
+    ).returning(literal_column("xmax = 0").label("inserted"))
+
+    now = datetime.utcnow()
+    params = [
+        {
+            **{field: row.get(field) for field in ITEM_FIELDS},
+            "content_hash": content_hash(row),
+            "from_source": source,
+            "last_updated": now,
+        }
+        for row in rows
+    ]
+    written = session.execute(stmt, params).scalars().all()
+    inserted = sum(written)
+    return UpsertResult(
+        inserted=inserted,
+        updated=len(written) - inserted,
+        unchanged=len(rows) - len(written),
+    )
+
+
+def upsert_crawled(session: Session, urls: list[str]) -> UpsertResult:
+    """
+    Record urls as crawled now, refreshing ``last_crawled`` of known ones.
+
+    :param session: database session.
+    :param urls: crawled urls.
+    :returns: number of inserted and updated rows.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return UpsertResult()
+
+    table = CrawledItem.__table__  # type: ignore
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.raw_url],
+        set_={"last_crawled": stmt.excluded.last_crawled},
+    ).returning(literal_column("xmax = 0").label("inserted"))
+
+    now = datetime.utcnow()
+    written = (
+        session.execute(
+            stmt, [{"raw_url": url, "last_crawled": now} for url in urls]
+        )
+        .scalars()
+        .all()
+    )
+    inserted = sum(written)
+    return UpsertResult(inserted=inserted, updated=len(written) - inserted)
@@ -0,0 +1,219 @@
+import fcntl
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.files import file_lock, replacing
+from app.ml.vectors import EmbeddingStore
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def _assign(
+    vectors: np.ndarray, centroids: np.ndarray, block: int = 8192
+) -> np.ndarray:
+    # closest centroid by cosine, a block of rows at a time
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block):
+        x = _normalize(vectors[start : start + block])
+        labels[start : start + len(x)] = np.argmax(x @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(
+    vectors: np.ndarray, n: int, iterations: int = 10, seed: int = 0
+) -> np.ndarray:
+    """
+    Spherical k-means.
+
+    :returns: ``n`` unit centroids.
+    """
+    rng = np.random.default_rng(seed)
+    x = _normalize(vectors)
+    centroids = x[rng.choice(len(x), n, replace=False)]
+    for _ in range(iterations):
+        labels = _assign(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        # empty lists restart from random vectors
+        empty = np.bincount(labels, minlength=n) == 0
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class VectorIndex:
+    """
+    Inverted file index of the rows of an ``EmbeddingStore``.
+
+    The vectors are clustered around ``sqrt(n)`` centroids and the store
+    rows are kept grouped by closest centroid, a search scores the rows
+    of the ``probes`` lists closest to the query. Rows appended to the
+    store later go to a tail of list ids, which is merged into the lists
+    with the same centroids once it grows past ``ANN_TAIL_FRACTION`` of
+    them. The centroids are computed again only for a new model version.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.ANN_INDEX_DIR)
+        self.generation: Optional[str] = None
+        self.version: Optional[str] = None
+        self._tail_stat: Optional[tuple[int, int]] = None
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self._rows = np.empty(0, dtype="<i8")
+        self._offsets = np.zeros(1, dtype="<i8")
+        self._tail = np.empty(0, dtype=np.int32)
+        self._packed = 0
+
+    def load(self) -> "VectorIndex":
+        """
+        Map the current index, cheap when nothing changed since the last
+        call.
+        """
+        with file_lock(self.root, fcntl.LOCK_SH):
+            self._load()
+        return self
+
+    def _load(self) -> None:
+        try:
+            generation = (self.root / "CURRENT").read_text().strip()
+        except FileNotFoundError:
+            return
+        path = self.root / generation
+        if generation != self.generation:
+            meta = json.loads((path / "meta.json").read_text())
+            self.version, self._packed = meta["version"], meta["packed"]
+            self.centroids = np.load(path / "centroids.npy")
+            # plain views slice faster than memmap objects
+            self._rows = np.asarray(np.load(path / "rows.npy", mmap_mode="r"))
+            self._offsets = np.load(path / "offsets.npy")
+            self.generation, self._tail_stat = generation, None
+        stat = os.stat(path / "tail.npy")
+        if (stat.st_ino, stat.st_mtime_ns) != self._tail_stat:
+            self._tail = np.load(path / "tail.npy")
+            self._tail_stat = (stat.st_ino, stat.st_mtime_ns)
+
+    def __len__(self) -> int:
+        return self._packed + len(self._tail)
+
+    def update(self, store: EmbeddingStore) -> int:
+        """
+        Index the rows appended to the store since the last update, all
+        of them when the store holds another model version.
+
+        :returns: number of indexed rows.
+        """
+        with file_lock(self.root, fcntl.LOCK_EX):
+            self._load()
+            store.load()
+            if self.version != store.version or len(self.centroids) == 0:
+                return self._build(store, None)
+            if len(store) <= len(self):
+                return 0
+            added = _assign(store.vectors()[len(self) :], self.centroids)
+            tail = np.concatenate([self._tail, added])
+            if len(tail) > settings.ANN_TAIL_FRACTION * self._packed:
+                self._build(store, self.centroids)
+            else:
+                path = self.root / self.generation / "tail.npy"
+                with replacing(path, "wb") as f:
+                    np.save(f, tail)
+                self._load()
+            return len(added)
+
+    def _build(
+        self, store: EmbeddingStore, centroids: Optional[np.ndarray]
+    ) -> int:
+        vectors = store.vectors()
+        if len(vectors) and centroids is None:
+            n = max(1, int(np.sqrt(len(vectors))))
+            rng = np.random.default_rng(0)
+            sample = np.sort(
+                rng.choice(
+                    len(vectors),
+                    min(len(vectors), settings.ANN_TRAIN_SAMPLE),
+                    replace=False,
+                )
+            )
+            centroids = kmeans(vectors[sample], n)
+        elif centroids is None:
+            centroids = np.empty((0, 0), dtype=np.float32)
+        labels = (
+            _assign(vectors, centroids)
+            if len(vectors)
+            else np.empty(0, dtype=np.int32)
+        )
+        rows = np.argsort(labels, kind="stable")
+        offsets = np.searchsorted(labels[rows], np.arange(len(centroids) + 1))
+
+        generation = f"{datetime.utcnow():%Y%m%d%H%M%S%f}"
+        path = self.root / generation
+        path.mkdir(parents=True)
+        np.save(path / "centroids.npy", centroids)
+        np.save(path / "rows.npy", rows.astype("<i8"))
+        np.save(path / "offsets.npy", offsets.astype("<i8"))
+        np.save(path / "tail.npy", np.empty(0, dtype=np.int32))
+        (path / "meta.json").write_text(
+            json.dumps({"version": store.version, "packed": len(vectors)})
+        )
+        with replacing(self.root / "CURRENT") as f:
+            f.write(generation)
+        # mapped files stay readable after they are unlinked
+        for old in self.root.iterdir():
+            if old.is_dir() and old.name != generation:
+                shutil.rmtree(old, ignore_errors=True)
+        self._load()
+        return len(vectors)
+
+    def candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        """
+        Store rows of the ``probes`` lists closest to the query.
+        """
+        closest = np.argsort(-(self.centroids @ query))[:probes]
+        lists = [
+            self._rows[self._offsets[i] : self._offsets[i + 1]] for i in closest
+        ]
+        tail = np.flatnonzero(np.isin(self._tail, closest)) + self._packed
+        return np.concatenate([*lists, tail])
+
+    def search(
+        self,
+        store: EmbeddingStore,
+        vector: np.ndarray,
+        k: int = 10,
+        probes: Optional[int] = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Items of the store closest to a vector by cosine similarity.
+
+        Every row of the store is scored while the index is built for
+        another model version.
+
+        :param store: loaded store the index was built from.
+        :param vector: query vector of the store model.
+        :param k: number of items.
+        :param probes: lists searched, ``ANN_PROBES`` if None.
+        :returns: ids of the items and their similarities, best first.
+        """
+        query = _normalize(vector)
+        if self.version == store.version and len(self.centroids):
+            rows = self.candidates(query, probes or settings.ANN_PROBES)
+            rows = rows[rows < len(store)]
+        else:
+            rows = np.arange(len(store))
+        scores = _normalize(store.vectors()[rows]) @ query
+        if len(rows) > k:
+            top = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return store.ids()[rows[order]], scores[order]
@@ -0,0 +1,46 @@
+from collections.abc import Iterator, Sequence
+
+import numpy as np
+from gensim.models.doc2vec import TaggedDocument
+from sqlmodel import Session, text
+
+from app.ml.tokens import TokenCache
+
+# a uniform sample drawn by Postgres, which keeps only the top ``size``
+# random keys while scanning, so the catalog never reaches the worker
+SAMPLE_ITEMS = text("SELECT id FROM item ORDER BY random() LIMIT :size")
+
+
+def sample_items(session: Session, size: int) -> np.ndarray:
+    """
+    Ids of ``size`` random items, every item if the catalog is smaller.
+    """
+    ids = session.execute(SAMPLE_ITEMS, {"size": size}).scalars()
+    return np.fromiter(ids, dtype="<i8")
+
+
+class Corpus(Sequence):
+    """
+    Training documents read from the token cache on every pass.
+
+    Only the item ids are held in memory, tokens are read from the memory
+    mapped cache, so gensim can iterate once per epoch over any number of
+    documents. Documents are tagged by their position.
+
+    :param cache: loaded token cache.
+    :param ids: ids of the items, those missing from the cache are left out.
+    """
+
+    def __init__(self, cache: TokenCache, ids: np.ndarray):
+        self.cache = cache
+        self.ids = ids[np.isin(ids, cache.ids())]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, i: int) -> TaggedDocument:
+        return TaggedDocument(self.cache.tokens(int(self.ids[i])), [i])
+
+    def __iter__(self) -> Iterator[TaggedDocument]:
+        for i in range(len(self.ids)):
+            yield self[i]
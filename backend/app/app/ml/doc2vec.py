@@ -0,0 +1,134 @@
+import collections
+import secrets
+from collections.abc import Sequence
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import gensim
+import numpy as np
+from gensim.models.doc2vec import Doc2Vec, TaggedDocument
+
+from app.core.config import settings
+from app.core.files import replacing
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Tokens of an abstract, as the doc2vec model is trained on.
+    """
+    text = gensim.parsing.preprocessing.strip_punctuation(text)
+    return gensim.utils.simple_preprocess(text)
+
+
+def evaluate(
+    model: Doc2Vec,
+    corpus: Sequence[TaggedDocument],
+    sample: Optional[int] = None,
+    block: int = 1024,
+    seed: Optional[int] = None,
+) -> collections.Counter:
+    """
+    Rank of every training document among the doc vectors when its words
+    are inferred again, 0 when it is found most similar to itself.
+
+    Inferred vectors are compared with every doc vector in one matrix
+    product per block of documents. The rank is the number of doc vectors
+    more similar than the document itself, so nothing is sorted.
+
+    :param model: trained model, documents are tagged by their position.
+    :param corpus: training documents.
+    :param sample: number of random documents to rank, all if None or 0.
+    :param block: documents compared per matrix product, bounds the
+        memory to ``block * len(model.dv)`` floats.
+    :param seed: seed of the sample.
+    :returns: histogram of the ranks.
+    """
+    doc_ids = np.arange(len(corpus))
+    if sample and sample < len(corpus):
+        rng = np.random.default_rng(seed)
+        doc_ids = rng.choice(doc_ids, sample, replace=False)
+    vectors = model.dv.get_normed_vectors()
+
+    ranks = collections.Counter()
+    for begin in range(0, len(doc_ids), block):
+        ids = doc_ids[begin : begin + block]
+        inferred = np.stack([model.infer_vector(corpus[i].words) for i in ids])
+        inferred /= np.linalg.norm(inferred, axis=1, keepdims=True) + 1e-12
+        sims = inferred @ vectors.T
+        own = sims[np.arange(len(ids)), ids]
+        ranks.update((sims > own[:, None]).sum(axis=1).tolist())
+    return ranks
+
+
+class ModelStore:
+    """
+    Versioned doc2vec models on disk.
+
+    Every trained model is saved under ``doc2vec-<version>.model``, the
+    ``CURRENT`` file names the version in use and is replaced atomically.
+    The version is stored with every item vector, so vectors of another
+    model are known to be stale.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.MODEL_DIR)
+        self._loaded: Optional[tuple[str, Doc2Vec]] = None
+
+    def _path(self, version: str) -> Path:
+        return self.root / f"doc2vec-{version}.model"
+
+    def current(self) -> Optional[str]:
+        """
+        Version of the model in use, None before the first training.
+        """
+        try:
+            return (self.root / "CURRENT").read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def save(self, model: Doc2Vec) -> str:
+        """
+        Save a trained model and make it the current one.
+
+        Models older than the one it replaces are removed.
+
+        :returns: version of the model.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        version = f"{datetime.utcnow():%Y%m%d%H%M%S}-{secrets.token_hex(4)}"
+        # arrays in their own files can be mapped, see ``load``
+        model.save(str(self._path(version)), sep_limit=0)
+        previous = self.current()
+
+        with replacing(self.root / "CURRENT") as f:
+            f.write(version)
+
+        # gensim may store large arrays next to the model, same prefix
+        keep = {version, previous}
+        for path in self.root.glob("doc2vec-*.model*"):
+            name = path.name.removeprefix("doc2vec-")
+            if name.split(".model", 1)[0] not in keep:
+                path.unlink(missing_ok=True)
+        return version
+
+    def load(
+        self, version: Optional[str] = None, mmap: Optional[str] = None
+    ) -> Optional[tuple[str, Doc2Vec]]:
+        """
+        A model and its version, loaded once per process and again when
+        another version is asked for.
+
+        :param version: version of the model, the current one if None.
+            The previous version is kept until the next training.
+        :param mmap: map the arrays of the model instead of reading them,
+            ``"r"`` shares their pages between processes.
+        :returns: None if there is no such model.
+        """
+        version = version or self.current()
+        if version is None or not self._path(version).exists():
+            return None
+        if self._loaded is None or self._loaded[0] != version:
+            model = Doc2Vec.load(str(self._path(version)), mmap=mmap)
+            self._loaded = (version, model)
+        return self._loaded
@@ -0,0 +1,234 @@
+import fcntl
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.core.files import file_lock, replacing
+from app.ml.doc2vec import tokenize
+
+# the digest is kept as raw bytes, a bytes field would drop trailing NULs
+INDEX_DTYPE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("hash", "u1", (16,)),
+        ("start", "<i8"),
+        ("length", "<i4"),
+    ]
+)
+# items changed since the last sync, with a margin for transactions that
+# committed late, a few items are tokenized twice
+CHANGED_ITEMS = text(
+    """
+    SELECT id, decode(md5(abstract), 'hex'), abstract FROM item
+    WHERE last_updated >= :since
+    ORDER BY id
+    """
+)
+SYNC_MARGIN = timedelta(hours=1)
+
+
+class TokenCache:
+    """
+    Tokenized abstracts on disk, keyed by item id and abstract digest.
+
+    Tokens are kept as space separated UTF-8 in append-only segments, each
+    a pair of ``.npy`` files: the tokens of its items and an index of item
+    id, md5 of the abstract, offset and length. Segments are memory-mapped,
+    so the pages are shared by every process on the host. The latest
+    segment wins for an item, segments are merged once there are more than
+    ``TOKEN_CACHE_SEGMENTS``.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.TOKEN_CACHE_DIR)
+        self._tokens: list[np.ndarray] = []
+        self._ids = np.empty(0, dtype="<i8")
+        self._index = np.empty(0, dtype=INDEX_DTYPE)
+        self._segment = np.empty(0, dtype="<i4")
+
+    def _segments(self) -> list[str]:
+        return sorted(
+            path.name.removesuffix(".idx.npy")
+            for path in self.root.glob("*.idx.npy")
+        )
+
+    def load(self) -> "TokenCache":
+        """
+        Map the current segments, call again to see later updates.
+        """
+        with file_lock(self.root, fcntl.LOCK_SH):
+            self._load(self._segments())
+        return self
+
+    def _load(self, names: list[str]) -> None:
+        indexes = [np.load(self.root / f"{name}.idx.npy") for name in names]
+        self._tokens = [
+            np.load(self.root / f"{name}.tok.npy", mmap_mode="r")
+            for name in names
+        ]
+        if not indexes:
+            return
+        index = np.concatenate(indexes)
+        segment = np.concatenate(
+            [np.full(len(x), i, dtype="<i4") for i, x in enumerate(indexes)]
+        )
+        # the last entry of an item wins, np.unique keeps the first one
+        ids, first = np.unique(index["id"][::-1], return_index=True)
+        latest = len(index) - 1 - first
+        self._ids, self._index = ids, index[latest]
+        self._segment = segment[latest]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def ids(self) -> np.ndarray:
+        """
+        Sorted ids of the cached items.
+        """
+        return self._ids
+
+    def _find(self, item_id: int) -> int:
+        i = int(np.searchsorted(self._ids, item_id))
+        if i < len(self._ids) and self._ids[i] == item_id:
+            return i
+        return -1
+
+    def tokens(
+        self, item_id: int, digest: Optional[bytes] = None
+    ) -> Optional[list[str]]:
+        """
+        Cached tokens of an item.
+
+        :param item_id: item id.
+        :param digest: md5 of the current abstract, the cached tokens must
+            come from it if given.
+        :returns: tokens, None if the item is not cached or changed since.
+        """
+        i = self._find(item_id)
+        if i < 0:
+            return None
+        entry = self._index[i]
+        if digest is not None and entry["hash"].tobytes() != digest:
+            return None
+        data = self._tokens[self._segment[i]]
+        start = int(entry["start"])
+        raw = data[start : start + int(entry["length"])].tobytes()
+        return raw.decode().split(" ") if raw else []
+
+    def documents(
+        self, ids: Optional[Iterable[int]] = None
+    ) -> Iterator[tuple[int, list[str]]]:
+        """
+        Tokens of the given items, or of every cached item, by id.
+        """
+        for item_id in self._ids if ids is None else ids:
+            tokens = self.tokens(int(item_id))
+            if tokens is not None:
+                yield int(item_id), tokens
+
+    def append(self, items: Iterable[tuple[int, bytes, str]]) -> int:
+        """
+        Tokenize abstracts into a new segment.
+
+        :param items: item id, md5 of the abstract and the abstract.
+        :returns: number of cached items.
+        """
+        index, chunks, offset = [], [], 0
+        for item_id, digest, abstract in items:
+            data = " ".join(tokenize(abstract)).encode()
+            index.append(
+                (item_id, np.frombuffer(digest, np.uint8), offset, len(data))
+            )
+            chunks.append(data)
+            offset += len(data)
+        if index:
+            with file_lock(self.root, fcntl.LOCK_EX):
+                name = f"{datetime.utcnow():%Y%m%d%H%M%S%f}"
+                self._write(
+                    name,
+                    np.array(index, dtype=INDEX_DTYPE),
+                    np.frombuffer(b"".join(chunks), dtype=np.uint8),
+                )
+        return len(index)
+
+    def _write(self, name: str, index: np.ndarray, tokens: np.ndarray) -> None:
+        # the tokens land before the index that makes the segment visible
+        for suffix, array in ((".tok.npy", tokens), (".idx.npy", index)):
+            with replacing(self.root / f"{name}{suffix}", "wb") as f:
+                np.save(f, array)
+
+    def sync(self, session: Session, batch_size: int = 1000) -> int:
+        """
+        Tokenize the items changed since the last sync, then merge the
+        segments if there are too many.
+
+        :param session: database session.
+        :param batch_size: items tokenized per segment.
+        :returns: number of tokenized items.
+        """
+        stamp = self.root / "SYNCED"
+        since = datetime.min
+        if stamp.exists():
+            since = datetime.fromisoformat(stamp.read_text()) - SYNC_MARGIN
+        started = datetime.utcnow()
+
+        self.load()
+        count = 0
+        rows = session.execute(
+            CHANGED_ITEMS,
+            {"since": since},
+            execution_options={"yield_per": batch_size},
+        )
+        for batch in rows.partitions(batch_size):
+            count += self.append(
+                (item_id, bytes(digest), abstract)
+                for item_id, digest, abstract in batch
+                if self.tokens(item_id, bytes(digest)) is None
+            )
+        self.root.mkdir(parents=True, exist_ok=True)
+        stamp.write_text(started.isoformat())
+        if len(self._segments()) > settings.TOKEN_CACHE_SEGMENTS:
+            self.compact(session)
+        self.load()
+        return count
+
+    def compact(self, session: Session) -> None:
+        """
+        Merge every segment into one, leaving out deleted items.
+
+        Processes that mapped the old segments keep reading them until
+        they load again.
+        """
+        with file_lock(self.root, fcntl.LOCK_EX):
+            names = self._segments()
+            self._load(names)
+            live = np.fromiter(
+                session.execute(text("SELECT id FROM item")).scalars(),
+                dtype="<i8",
+            )
+            keep = np.flatnonzero(np.isin(self._ids, live))
+            index = np.empty(len(keep), dtype=INDEX_DTYPE)
+            chunks, offset = [], 0
+            for row, i in enumerate(keep):
+                entry = self._index[i]
+                start = int(entry["start"])
+                data = self._tokens[self._segment[i]]
+                chunks.append(data[start : start + int(entry["length"])])
+                index[row] = (
+                    entry["id"],
+                    entry["hash"],
+                    offset,
+                    entry["length"],
+                )
+                offset += int(entry["length"])
+            tokens = np.concatenate(chunks) if chunks else np.empty(0, np.uint8)
+            # sorts right after the segments it replaces
+            self._write(f"{names[-1]}-merged", index, tokens)
+            for name in names:
+                for suffix in (".idx.npy", ".tok.npy"):
+                    (self.root / f"{name}{suffix}").unlink(missing_ok=True)
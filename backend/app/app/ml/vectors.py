@@ -0,0 +1,241 @@
+import fcntl
+import json
+import shutil
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.core.files import file_lock, replacing
+
+EMBEDDED_ITEMS = text(
+    """
+    SELECT id, doc2vec FROM item
+    WHERE embedding_version = :version AND doc2vec IS NOT NULL
+    ORDER BY id
+    """
+)
+
+
+class EmbeddingStore:
+    """
+    Item vectors of one model version in a single contiguous matrix.
+
+    A generation directory holds ``vectors.npy``, a preallocated matrix of
+    ``EMBEDDING_DTYPE`` rows, ``ids.npy`` with the item id of every row
+    and ``COUNT``, the number of rows in use. Readers map the matrix
+    read-only and only look at the first ``COUNT`` rows. New vectors are
+    written past them and become visible when ``COUNT`` is replaced. A
+    full matrix, or a new model version, is written to a new generation
+    that ``CURRENT`` switches to atomically.
+    """
+
+    def __init__(self, root: Optional[str] = None, dtype: Optional[str] = None):
+        self.root = Path(root or settings.EMBEDDING_DIR)
+        self.dtype = np.dtype(dtype or settings.EMBEDDING_DTYPE)
+        self.generation: Optional[str] = None
+        self.version: Optional[str] = None
+        self._count = 0
+        self._mode: Optional[str] = None
+        self._ids = np.empty(0, dtype="<i8")
+        self._vectors = np.empty((0, 0), dtype=self.dtype)
+        self._order = np.empty(0, dtype="<i8")
+
+    def _current(self) -> tuple[Optional[str], int]:
+        try:
+            generation = (self.root / "CURRENT").read_text().strip()
+            count = int((self.root / generation / "COUNT").read_text())
+        except FileNotFoundError:
+            return None, 0
+        return generation, count
+
+    def load(self) -> "EmbeddingStore":
+        """
+        Map the current generation, cheap when nothing changed since the
+        last call.
+        """
+        with file_lock(self.root, fcntl.LOCK_SH):
+            self._load(mode="r")
+        return self
+
+    def _load(self, mode: str) -> None:
+        generation, count = self._current()
+        # a read-only mapping cannot be written by ``put``
+        unchanged = generation == self.generation and count == self._count
+        if unchanged and mode == self._mode:
+            return
+        self.generation, self._count = generation, count
+        if generation is None:
+            self.version = None
+            return
+        path = self.root / generation
+        self.version = json.loads((path / "meta.json").read_text())["version"]
+        self._ids = np.load(path / "ids.npy", mmap_mode=mode)
+        self._vectors = np.load(path / "vectors.npy", mmap_mode=mode)
+        self._mode = mode
+        self._order = np.argsort(self._ids[:count], kind="stable")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def ids(self) -> np.ndarray:
+        return self._ids[: self._count]
+
+    def vectors(self) -> np.ndarray:
+        """
+        Matrix of every vector, row ``i`` belongs to item ``ids()[i]``.
+        """
+        return self._vectors[: self._count]
+
+    def rows(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Row of every item, -1 for items without a vector.
+        """
+        ids = np.asarray(ids, dtype="<i8")
+        if not self._count:
+            return np.full(len(ids), -1)
+        known = self._ids[: self._count][self._order]
+        pos = np.minimum(np.searchsorted(known, ids), self._count - 1)
+        return np.where(known[pos] == ids, self._order[pos], -1)
+
+    def get(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectors of the given items.
+
+        :returns: ids of the items that have a vector, and their vectors.
+        """
+        rows = self.rows(ids)
+        found = rows >= 0
+        return np.asarray(ids)[found], np.asarray(self._vectors[rows[found]])
+
+    def put(
+        self,
+        version: str,
+        ids: list[int],
+        vectors: np.ndarray,
+        commit: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Store vectors of a model version, in place for known items.
+
+        Vectors of another version than the store are ignored, the store
+        is rebuilt once every item has a vector of the new version.
+
+        :param commit: commits the vectors to the database, called under
+            the store lock once they are stored or ignored, so a rebuild
+            either reads them or switches to their version before they
+            are stored.
+        """
+        with file_lock(self.root, fcntl.LOCK_EX):
+            self._store(version, ids, vectors)
+            if commit is not None:
+                commit()
+
+    def _store(self, version: str, ids: list[int], vectors: np.ndarray) -> None:
+        self._load(mode="r+")
+        if self.version != version or not len(ids):
+            return
+        rows = self.rows(np.asarray(ids))
+        known = rows >= 0
+        self._vectors[rows[known]] = vectors[known]
+        new_ids = np.asarray(ids)[~known]
+        if self._count + len(new_ids) > len(self._ids):
+            self._vectors.flush()
+            self._grow(len(new_ids))
+        end = self._count + len(new_ids)
+        self._ids[self._count : end] = new_ids
+        self._vectors[self._count : end] = vectors[~known]
+        self._ids.flush()
+        self._vectors.flush()
+        with replacing(self.root / self.generation / "COUNT") as f:
+            f.write(str(end))
+        self._load(mode="r+")
+
+    def _grow(self, n: int) -> None:
+        # copy into a generation twice as large, readers keep the old one
+        capacity = 2 * (self._count + n)
+        generation = self._create(
+            self.version, capacity, self._vectors.shape[1]
+        )
+        path = self.root / generation
+        ids = np.load(path / "ids.npy", mmap_mode="r+")
+        vectors = np.load(path / "vectors.npy", mmap_mode="r+")
+        ids[: self._count] = self._ids[: self._count]
+        vectors[: self._count] = self._vectors[: self._count]
+        ids.flush()
+        vectors.flush()
+        self._switch(generation, self._count)
+        self._load(mode="r+")
+
+    def _create(self, version: str, capacity: int, dim: int) -> str:
+        generation = f"{datetime.utcnow():%Y%m%d%H%M%S%f}"
+        path = self.root / generation
+        path.mkdir(parents=True)
+        np.lib.format.open_memmap(
+            path / "ids.npy", mode="w+", dtype="<i8", shape=(capacity,)
+        ).flush()
+        np.lib.format.open_memmap(
+            path / "vectors.npy",
+            mode="w+",
+            dtype=self.dtype,
+            shape=(capacity, dim),
+        ).flush()
+        (path / "meta.json").write_text(json.dumps({"version": version}))
+        return generation
+
+    def _switch(self, generation: str, count: int) -> None:
+        with replacing(self.root / generation / "COUNT") as f:
+            f.write(str(count))
+        with replacing(self.root / "CURRENT") as f:
+            f.write(generation)
+        # mapped files stay readable after they are unlinked
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name != generation:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def rebuild(
+        self, session: Session, version: str, batch_size: int = 1000
+    ) -> int:
+        """
+        Write the vectors of a model version to a new generation and
+        switch to it.
+
+        :returns: number of stored vectors.
+        """
+        # vectors are committed under the lock, see ``put``, none can land
+        # between the count and the read
+        with file_lock(self.root, fcntl.LOCK_EX):
+            total, dim = session.execute(
+                text(
+                    "SELECT count(*), max(length(doc2vec)) / 4 FROM item"
+                    " WHERE embedding_version = :version"
+                    " AND doc2vec IS NOT NULL"
+                ),
+                {"version": version},
+            ).one()
+            generation = self._create(version, max(1, total), dim or 0)
+            path = self.root / generation
+            ids = np.load(path / "ids.npy", mmap_mode="r+")
+            vectors = np.load(path / "vectors.npy", mmap_mode="r+")
+            count = 0
+            rows = session.execute(
+                EMBEDDED_ITEMS,
+                {"version": version},
+                execution_options={"yield_per": batch_size},
+            )
+            for batch in rows.partitions(batch_size):
+                end = count + len(batch)
+                ids[count:end] = [item_id for item_id, _ in batch]
+                vectors[count:end] = np.frombuffer(
+                    b"".join(data for _, data in batch), dtype=np.float32
+                ).reshape(len(batch), -1)
+                count = end
+            ids.flush()
+            vectors.flush()
+            self._switch(generation, count)
+            self._load(mode="r+")
+        return count
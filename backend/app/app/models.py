@@ -8,15 +8,23 @@ from sqlalchemy.orm.exc import FlushError
 from sqlmodel import (
     JSON,
     AutoString,
+    BigInteger,
     Column,
     Field,
+    Index,
     LargeBinary,
     SQLModel,
     select,
+    text,
 )
 
 from app.core.security import get_password_hash, verify_password
 
+# the vector of an item is missing or older than its content
+EMBEDDING_STALE = (
+    "doc2vec IS NULL OR embedding_hash IS DISTINCT FROM content_hash"
+)
+
 
 class ActiveRecordMixin:
     __config__ = None
@@ -278,6 +286,17 @@ class ItemUpdate(ItemBase):
 
 # Database model, database table inferred from class name
 class Item(ActiveRecordMixin, ItemBase, table=True):
+    # items waiting for a vector are found without reading the catalog,
+    # see ``app.db.embedding``
+    __table_args__ = (
+        Index(
+            "ix_item_embedding_stale",
+            "id",
+            postgresql_where=text(EMBEDDING_STALE),
+        ),
+        Index("ix_item_embedding_version", "embedding_version"),
+    )
+
     id: Union[int, None] = Field(default=None, primary_key=True)
     is_hidden: bool = False
 
@@ -285,6 +304,7 @@ class Item(ActiveRecordMixin, ItemBase, table=True):
     last_updated: datetime = Field(
         default_factory=datetime.utcnow,
         nullable=False,
+        index=True,
     )
     category: Union[list[str], None] = Field(
         default=None,
@@ -294,6 +314,17 @@ class Item(ActiveRecordMixin, ItemBase, table=True):
         default=None,
         sa_column=Column(LargeBinary),
     )
+    # model version and ``content_hash`` the vector was inferred from, see
+    # ``app.db.embedding``
+    embedding_version: Optional[str] = None
+    embedding_hash: Optional[str] = None
+    # digest of the updatable fields, see ``app.db.upsert.content_hash``
+    content_hash: Optional[str] = None
+    # MinHash signature of title and abstract, see ``app.db.dedup``
+    minhash: Optional[bytes] = Field(
+        default=None,
+        sa_column=Column(LargeBinary),
+    )
 
 
 # Properties to return via API, id is always required
@@ -301,15 +332,79 @@ class ItemOut(ItemBase):
     id: int
 
 
+class ItemBand(SQLModel, table=True):
+    """
+    LSH bucket of one band of the MinHash signature of an item.
+    """
+
+    band: int = Field(primary_key=True)
+    hash: int = Field(primary_key=True, sa_type=BigInteger)
+    # bands go with their item, however it is deleted
+    item_id: int = Field(
+        primary_key=True, foreign_key="item.id", ondelete="CASCADE", index=True
+    )
+
+
 class CrawledItem(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True)
-    raw_url: str = Field(nullable=False)
+    raw_url: str = Field(nullable=False, unique=True, index=True)
     last_crawled: datetime = Field(
         default_factory=datetime.utcnow,
         nullable=False,
     )
 
 
+class CrawlFrontier(SQLModel, table=True):
+    """
+    Next visit of a url of a source, see ``app.db.frontier``.
+    """
+
+    __table_args__ = (
+        Index("ix_crawlfrontier_due", "source", "listing", "next_due"),
+    )
+
+    source: str = Field(primary_key=True)
+    url: str = Field(primary_key=True)
+    # the url lists the pages of the source, e.g. a schedule or a feed
+    listing: bool = False
+    next_due: datetime = Field(nullable=False)
+    revisit_seconds: float = Field(nullable=False)
+    last_crawled: Optional[datetime] = None
+    # sha256 of the content at the last crawl
+    digest: Optional[str] = None
+
+
+class CrawlCheckpoint(SQLModel, table=True):
+    """
+    Progress of a crawl task, committed with each chunk of its items.
+    """
+
+    key: str = Field(primary_key=True)
+    # units of work (urls or feed entries) already committed
+    offset: int = Field(nullable=False)
+    # kept after the work is complete, e.g. a backfilled year
+    done: bool = Field(default=False, nullable=False)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        nullable=False,
+    )
+
+
+class CrawlBucket(SQLModel, table=True):
+    """
+    Cluster-wide request budget of a source, see ``app.source.throttle``.
+    """
+
+    source: str = Field(primary_key=True)
+    tokens: float = Field(nullable=False)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        nullable=False,
+    )
+    # moving average of task wall time per url, in seconds
+    url_latency: Optional[float] = None
+
+
 class FeedBack(SQLModel, ActiveRecordMixin, table=True):
     id: int = Field(default=None, primary_key=True)
     # 0: dislike, 1: like
@@ -1,31 +1,91 @@
-import xml.dom.minidom
+from collections.abc import Generator, Iterator
+from typing import Optional
 
-from scrapy.http import HtmlResponse
+import httpx
+from lxml import etree
 
-from app.source.base import PaperRequestsTask, PaperType
+from app.core.config import settings
+from app.source.base import ListingError, PaperRequestsTask, PaperType
+from app.source.selector import Page
+from app.source.throttle import TokenBucket
 
 
 class AAAI(PaperRequestsTask):
-    url: str = (
-        "https://dblp.uni-trier.de/search/publ/api?q=toc%3Adb/conf/aaai/aaai2023.bht%3A&h=1000&format=xml"
+    url_template: str = (
+        "https://dblp.uni-trier.de/search/publ/api?q=toc%3Adb/conf/aaai/aaai{year}.bht%3A&format=xml"
     )
+    url: str = url_template.format(year=2023)
     name: str = "AAAI"
+    # hits per request, the DBLP api serves at most 1000
+    page_size: int = 1000
+
+    @staticmethod
+    def parse_hits(
+        chunks: Iterator[bytes],
+    ) -> Generator[str, None, tuple[Optional[int], int]]:
+        """
+        Incrementally parse one page of DBLP search results.
+
+        Yields the first ``<ee>`` link of every hit as soon as it is read,
+        hits are discarded once parsed.
+
+        :param chunks: body of the response.
+        :returns: total hits of the query, None if the body has no
+            results, and hits on this page.
+        """
+        parser = etree.XMLPullParser(events=("start", "end"))
+        total, hits = None, 0
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == "start" and element.tag == "hits":
+                    total = int(element.get("total", 0))
+                elif event == "end" and element.tag == "hit":
+                    hits += 1
+                    ee = element.findtext(".//ee")
+                    if ee:
+                        yield ee
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+        parser.close()
+        return total, hits
+
+    @classmethod
+    def get_urls(cls, year: Optional[int] = None) -> Iterator[str]:
+        """
+        Page through the DBLP api until every hit of the query is read.
+
+        :param year: conference year to backfill, the current one if None.
+        :raises ListingError: if a page could not be fetched or read, the
+            urls yielded so far are only part of the listing.
+        """
+        bucket = TokenBucket(cls.name, cls.crawl_rate or settings.CRAWL_RATE)
+        query = cls.url if year is None else cls.url_for(year)
+        offset = 0
+        while True:
+            url = httpx.URL(query).copy_merge_params(
+                {"h": cls.page_size, "f": offset}
+            )
+            chunks = cls.fetcher.stream(str(url), throttle=bucket.wait)
+            try:
+                total, hits = yield from cls.parse_hits(chunks)
+            except etree.XMLSyntaxError as e:
+                raise ListingError(f"{url}: {e}") from e
+            # failed requests yield no body, a short page ends early
+            if total is None or (hits == 0 and offset < total):
+                raise ListingError(str(url))
+            offset += hits
+            if hits == 0 or offset >= total:
+                return
 
     @classmethod
-    def parse_urls(cls, response: HtmlResponse) -> list[str]:
-        _xml = response.text
-        domTree = xml.dom.minidom.parseString(_xml)
-        collection = domTree.documentElement
-
-        hits = collection.getElementsByTagName("hit")
-        urls = []
-        for hit in hits:
-            url = hit.getElementsByTagName("ee")[0]
-            urls.append(url.childNodes[0].data)
-        return urls
+    def changed_urls(cls) -> tuple[Iterator[str], None]:
+        # the api sends no validators, the listing is read in full
+        return cls.get_urls(), None
 
     @staticmethod
-    def parse(response: HtmlResponse):
+    def parse(response: Page):
         item = {
             "title": response.css("h1.page_title::text").get().strip(),  # type: ignore
             "abstract": response.css("section.abstract::text").getall()[1].strip(),  # type: ignore
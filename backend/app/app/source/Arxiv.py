@@ -1,9 +1,8 @@
 import re
 from typing import Any
 
-from scrapy.http import HtmlResponse
-
 from app.source.base import PaperType, RSSTask
+from app.source.selector import Page
 
 CATEGORY_MAP = {
     "cs.AI": "Artificial Intelligence",
@@ -51,15 +50,7 @@ class Arxiv(RSSTask):
     def post_parse(self, entry: PaperType) -> PaperType:
         category = re.findall(r"\[(.*?)\]", entry["title"])[0]
         entry["title"] = entry["title"].split("(", 1)[0]
-        entry["authors"] = (
-            HtmlResponse(url="", body=entry["authors"], encoding="utf-8")
-            .css("a::text")
-            .getall()
-        )
-        entry["abstract"] = (
-            HtmlResponse(url="", body=entry["abstract"], encoding="utf-8")
-            .css("p::text")
-            .get()
-        )
-        entry["category"] = category
+        entry["authors"] = Page("", entry["authors"]).css("a::text").getall()
+        entry["abstract"] = Page("", entry["abstract"]).css("p::text").get()
+        entry["category"] = [category]
         return entry
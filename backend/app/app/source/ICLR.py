@@ -2,5 +2,8 @@ from app.source.NIPS import NIPS
 
 
 class ICLR(NIPS):
-    url: str = "https://iclr.cc/Conferences/2023/Schedule?type=Poster"
+    url_template: str = (
+        "https://iclr.cc/Conferences/{year}/Schedule?type=Poster"
+    )
+    url: str = url_template.format(year=2023)
     name: str = "ICLR"
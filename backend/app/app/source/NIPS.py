@@ -1,23 +1,25 @@
-from scrapy.http import HtmlResponse
-
 from app.source.base import PaperRequestsTask, PaperType, openreview_url
+from app.source.selector import Page
 
 
 class NIPS(PaperRequestsTask):
-    url: str = "https://nips.cc/Conferences/2023/Schedule?type=Poster"
+    url_template: str = (
+        "https://nips.cc/Conferences/{year}/Schedule?type=Poster"
+    )
+    url: str = url_template.format(year=2023)
     name: str = "NIPS"
 
     @classmethod
-    def parse_urls(cls, response: HtmlResponse) -> list[str]:
+    def parse_urls(cls, response: Page) -> list[str]:
         poster_ids = response.css(".maincard::attr(id)").getall()
         urls = [
-            f"{cls.url}showEvent={poster_id.replace('maincard_', '')}"
+            f"{response.url}showEvent={poster_id.replace('maincard_', '')}"
             for poster_id in poster_ids
         ]
         return urls
 
     @staticmethod
-    def parse(response: HtmlResponse):
+    def parse(response: Page):
         item = {
             "title": response.css("div.maincardBody::text").get(),
             "authors": response.css("div.maincardFooter::text").get(),
@@ -0,0 +1,90 @@
+import logging
+from typing import Optional
+
+import httpx
+
+from app.source.base import ListingError, PaperRequestsTask, PaperType
+from app.source.metrics import ITEMS, STAGE_SECONDS
+from app.source.selector import Page
+
+
+class OpenReview(PaperRequestsTask):
+    """
+    Accepted papers of a venue read from the OpenReview api in pages of
+    ``page_size`` notes, instead of one HTML page per poster.
+
+    The listing asks for a single note and the total count to learn the
+    number of papers, the urls to crawl are the pages of notes. Other
+    venues subclass it with their own ``content.venueid``. Venues from
+    2024 on are served by the v2 api, notes of older venues read through
+    it keep their content as plain values.
+    """
+
+    url_template: str = (
+        "https://api2.openreview.net/notes"
+        "?content.venueid=ICLR.cc/{year}/Conference&limit=1&count=true"
+    )
+    url: str = url_template.format(year=2024)
+    name: str = "OpenReview"
+    forum_url: str = "https://openreview.net/forum?id={id}"
+    # notes per request, the api serves at most 1000
+    page_size: int = 1000
+
+    @classmethod
+    def parse_urls(cls, response: Page) -> list[str]:
+        count = response.json().get("count")
+        if count is None:
+            raise ListingError(f"{response.url}: no count of notes")
+        return [
+            str(
+                httpx.URL(response.url).copy_merge_params(
+                    {"limit": cls.page_size, "offset": offset}
+                )
+            )
+            for offset in range(0, count, cls.page_size)
+        ]
+
+    @classmethod
+    def parse_note(cls, note: dict) -> PaperType:
+        content = note["content"]
+
+        def value(field: str) -> Optional[str]:
+            # v2 wraps every field as {"value": ...}
+            field_value = content.get(field)
+            if isinstance(field_value, dict):
+                return field_value.get("value")
+            return field_value
+
+        return {
+            "title": value("title"),
+            "abstract": value("abstract"),
+            "url": cls.forum_url.format(id=note["forum"]),
+            "authors": value("authors"),
+            "keywords": value("keywords"),
+            "category": None,
+        }
+
+    @staticmethod
+    def post_parse(item: PaperType) -> PaperType:
+        for field in ("title", "abstract"):
+            if item[field] is not None:
+                item[field] = item[field].strip()  # type: ignore
+        return item
+
+    def parse_items(
+        self, url: str, response: Page
+    ) -> list[tuple[str, PaperType]]:
+        # a page holds many papers, each is recorded under its forum url
+        with STAGE_SECONDS.labels(self.name, "parse").time():
+            items = [self.parse_note(note) for note in response.json()["notes"]]
+        with STAGE_SECONDS.labels(self.name, "post_parse").time():
+            items = [self.post_parse(item) for item in items]
+
+        rows = []
+        for item in items:
+            if not item["title"] or not item["abstract"]:
+                logging.warning(f"Empty title or abstract: {item['url']}")
+                ITEMS.labels(self.name, "empty").inc()
+                continue
+            rows.append((item["url"], item))
+        return rows
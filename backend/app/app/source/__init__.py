@@ -3,6 +3,7 @@ from app.source.Arxiv import Arxiv
 from app.source.ICLR import ICLR
 from app.source.ICML import ICML
 from app.source.NIPS import NIPS
+from app.source.OpenReview import OpenReview
 from app.source.PMLR import PMLR
 
-__all__ = ["NIPS", "ICLR", "ICML", "Arxiv", "AAAI", "PMLR"]
+__all__ = ["NIPS", "ICLR", "ICML", "Arxiv", "AAAI", "PMLR", "OpenReview"]
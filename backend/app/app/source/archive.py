@@ -0,0 +1,104 @@
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import zstandard
+
+from app.core.config import settings
+from app.core.files import replacing
+
+
+class PageArchive:
+    """
+    Content-addressed archive of fetched pages.
+
+    Bodies are zstd-compressed and stored once per sha256 digest under
+    ``objects/``. Every fetch appends the url, fetch time and digest of the
+    page to ``index/<source>.jsonl``, so pages can be replayed through the
+    parsers without touching the origin again.
+    """
+
+    def __init__(self, root: Optional[str] = None, level: Optional[int] = None):
+        self.root = Path(root or settings.ARCHIVE_DIR)
+        self.level = level or settings.ARCHIVE_ZSTD_LEVEL
+
+    def _object(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.zst"
+
+    def _index(self, source: str) -> Path:
+        return self.root / "index" / f"{source}.jsonl"
+
+    def put(
+        self,
+        source: str,
+        url: str,
+        body: bytes,
+        fetched_at: Optional[datetime] = None,
+    ) -> str:
+        """
+        Archive a fetched page.
+
+        :param source: source name.
+        :param url: fetched url.
+        :param body: raw response body.
+        :param fetched_at: fetch time, now if None.
+        :returns: digest of the body.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            data = zstandard.ZstdCompressor(level=self.level).compress(body)
+            with replacing(path, "wb") as f:
+                f.write(data)
+
+        entry = {
+            "url": url,
+            "fetched_at": (fetched_at or datetime.utcnow()).isoformat(),
+            "digest": digest,
+        }
+        index = self._index(source)
+        index.parent.mkdir(parents=True, exist_ok=True)
+        # one short append per line, concurrent workers do not interleave
+        with open(index, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        """
+        Raw body of an archived page.
+        """
+        data = self._object(digest).read_bytes()
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    def entries(self, source: str) -> list[dict]:
+        """
+        Every archived fetch of a source, oldest first.
+        """
+        index = self._index(source)
+        if not index.exists():
+            return []
+        with open(index) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return sorted(entries, key=lambda entry: entry["fetched_at"])
+
+    def latest(self, source: str) -> list[tuple[str, str]]:
+        """
+        Url and digest of the most recent fetch of every url of a source.
+        """
+        latest = {
+            entry["url"]: entry["digest"] for entry in self.entries(source)
+        }
+        return list(latest.items())
+
+    def snapshots(self, source: str) -> list[tuple[str, str]]:
+        """
+        Url and digest of every distinct body archived for a source.
+        """
+        seen = {
+            (entry["url"], entry["digest"]): None
+            for entry in self.entries(source)
+        }
+        return list(seen)
@@ -1,15 +1,45 @@
+import hashlib
 import logging
-from datetime import datetime
+import time
+from collections.abc import Iterable, Iterator
+from itertools import batched, islice
 from typing import Optional, TypedDict
 
 import feedparser
-import requests
 from celery import Task
 from feedparser import FeedParserDict
-from scrapy.http import HtmlResponse
-from sqlmodel import Session, select
-
-from app.models import CrawledItem, Item
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.db.checkpoint import (
+    backfill_key,
+    checkpoint_done,
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from app.db.dedup import index_items, merge_near_duplicates
+from app.db.frontier import add_urls, record_crawls
+from app.db.upsert import UpsertResult, upsert_crawled, upsert_items
+from app.source.archive import PageArchive
+from app.source.fetcher import Fetcher
+from app.source.metrics import (
+    ITEMS,
+    STAGE_SECONDS,
+    count_items,
+    observe_response,
+)
+from app.source.selector import Page
+from app.source.throttle import TokenBucket, record_latency
+
+# embeds the items stored by a crawl, see ``app.worker.infer_doc2vec``
+EMBED_TASK = "app.worker.infer_doc2vec"
+
+
+class ListingError(Exception):
+    """
+    The listing of a source could not be read in full.
+    """
 
 
 class PaperType(TypedDict):
@@ -30,11 +60,33 @@ def openreview_url(urls):
     return urls[0]  # if no openreview url, return the first url
 
 
+def request_embeddings(task: Task, result: UpsertResult) -> None:
+    """
+    Queue doc2vec inference once new or changed items are stored.
+    """
+    if result.inserted or result.updated:
+        task.app.send_task(EMBED_TASK)
+
+
+def _digest(response: Page) -> Optional[str]:
+    # None marks a page not modified since the last crawl
+    if response.status == 304:
+        return None
+    return hashlib.sha256(response.body).hexdigest()
+
+
 class PaperRequestsTask(Task):
     url: str
+    # listing of a given year, formatted with ``year``, for backfills
+    url_template: Optional[str] = None
     ignore_result: bool = True
     name: str
-    rate_limit = "30/m"
+    fetcher: Fetcher = Fetcher()
+    archive: Optional[PageArchive] = (
+        PageArchive() if settings.ARCHIVE_DIR else None
+    )
+    # requests per second across the cluster, CRAWL_RATE if None
+    crawl_rate: Optional[float] = None
 
     @property
     def db(self):
@@ -46,112 +98,334 @@ class PaperRequestsTask(Task):
         return Session(engine)
 
     @classmethod
-    def parse_urls(cls, response: HtmlResponse) -> list[str]:
+    def parse_urls(cls, response: Page) -> list[str]:
         # you should return list of absolute urls
         raise NotImplementedError
 
     @classmethod
-    def get_urls(cls) -> list[str]:
-        response = cls._request(cls.url)
+    def url_for(cls, year: int) -> str:
+        """
+        Listing url of the conference of a year.
+        """
+        if cls.url_template is None:
+            raise ValueError(f"{cls.name} has no listing per year")
+        return cls.url_template.format(year=year)
+
+    @classmethod
+    def get_urls(cls, year: Optional[int] = None) -> list[str]:
+        """
+        Urls of the papers of a listing, fetched in full.
+
+        :param year: conference year to backfill, the current listing if
+            None.
+        :raises ListingError: if the listing could not be fetched.
+        """
+        url = cls.url if year is None else cls.url_for(year)
+        response = cls._request(url, False)
         if response is None:
-            return []
+            raise ListingError(url)
         return cls.parse_urls(response)
 
+    @classmethod
+    def changed_urls(cls) -> tuple[Iterable[str], Optional[Page]]:
+        """
+        Urls of the current listing, if it changed since its validators
+        were remembered.
+
+        The caller remembers the validators once the urls are stored, an
+        unchanged listing has no urls to lose then.
+
+        :returns: the urls, none if the listing is unchanged, and the
+            response to remember, None if there is nothing to remember.
+        :raises ListingError: if the listing could not be fetched.
+        """
+        response = cls._request(cls.url, True)
+        if response is None:
+            raise ListingError(cls.url)
+        # unchanged listing, its urls are already in the frontier
+        if response.status == 304:
+            return [], None
+        return cls.parse_urls(response), response
+
     @staticmethod
-    def parse(response: HtmlResponse) -> PaperType:
+    def parse(response: Page) -> PaperType:
         # you should return dict with fields:
         # title, abstract, url
         raise NotImplementedError
 
-    @staticmethod
+    @classmethod
+    def _request_many(
+        cls, urls: list[str], conditional: bool = True
+    ) -> list[Page | None]:
+        bucket = TokenBucket(
+            cls.name,
+            cls.crawl_rate or settings.CRAWL_RATE,
+            block=min(len(urls), settings.REQUESTS_PER_HOST_CONCURRENCY),
+        )
+        responses = cls.fetcher.fetch_all(
+            urls, throttle=bucket.acquire, conditional=conditional
+        )
+        for response in responses:
+            if response is not None:
+                observe_response(cls.name, response)
+        return [
+            (
+                None
+                if response is None
+                else Page(
+                    url,
+                    response.content,
+                    response.headers,
+                    response.status_code,
+                )
+            )
+            for url, response in zip(urls, responses)
+        ]
+
+    @classmethod
     def _request(
+        cls,
         url: str,
-    ) -> HtmlResponse | None:  # On the Take class have same method(request)
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            logging.error(e)
-            return
-        return HtmlResponse(url=url, body=response.content, encoding="utf-8")
+        conditional: bool = True,
+    ) -> Page | None:  # On the Take class have same method(request)
+        # None on failure, a bodiless 304 page if unchanged since last crawl
+        return cls._request_many([url], conditional)[0]
+
+    def write(
+        self, db: Session, rows: list[tuple[str, PaperType]], crawled: bool
+    ) -> UpsertResult:
+        """
+        Write items in the transaction of ``db``, commit is up to the caller.
 
-    def save(self, data: list[tuple[str, PaperType]]) -> None:
+        :param db: database session.
+        :param rows: crawled url and parsed item.
+        :param crawled: record the urls as crawled.
+        """
+        # TODO: add relations between CrawledItem and Item
+        if crawled:
+            upsert_crawled(db, [url for url, _ in rows])
+        items = [item for _, item in rows]
+        signatures = merge_near_duplicates(db, items)
+        result = upsert_items(db, items, self.name)
+        index_items(db, items, signatures)
+        return result
+
+    def save(
+        self, data: list[tuple[str, PaperType]], crawled: bool = True
+    ) -> UpsertResult:
+        result = UpsertResult()
         with self.db as db:
-            objs = [CrawledItem(raw_url=item[0]) for item in data]
-            for item in objs:
-                try:
-                    db.add(item)
-                    db.commit()
-                except Exception:
-                    db.rollback()
-                    logging.warning(f"Duplicate item: {item.raw_url}")
-
-                    # update CrawledItem table if exists
-                    existing_item = db.exec(
-                        select(CrawledItem).where(
-                            CrawledItem.raw_url == item.raw_url
-                        ),
-                    ).one()
-                    existing_item.last_crawled = datetime.utcnow()
-                    db.add(existing_item)
-                    db.commit()
-
-            # TODO: add relations between CrawledItem and Item
-            objs = [
-                Item(
-                    **item[1],
-                    from_source=self.name,
-                )
-                for item in data
-            ]
-            for item in objs:
-                try:
-                    db.add(item)
-                    db.commit()
-                except Exception:
-                    db.rollback()
-                    logging.warning(f"Duplicate item: {item.title}")
-
-                    # update Item table if exists
-                    existing_item = db.exec(
-                        select(Item).where(Item.title == item.title),
-                    ).one()
-                    existing_item.category = item.category
-                    existing_item.url = item.url
-                    existing_item.abstract = item.abstract
-                    existing_item.authors = item.authors
-                    existing_item.last_updated = datetime.utcnow()
-                    db.add(existing_item)
-                    db.commit()
+            for rows in batched(data, settings.SAVE_BATCH_SIZE):
+                result += self.write(db, list(rows), crawled)
+                db.commit()
+        logging.info(f"{self.name} saved: {result}")
+        request_embeddings(self, result)
+        return result
 
     @staticmethod
     def post_parse(data: PaperType) -> PaperType:
         # you can do some post processing here
         return data
 
-    def run(self, urls: list[str]):
-        results = []
-        for url in urls:
-            response = PaperRequestsTask._request(url)
-            if response is None:
-                continue
+    def parse_items(
+        self, url: str, response: Page
+    ) -> list[tuple[str, PaperType]]:
+        with STAGE_SECONDS.labels(self.name, "parse").time():
             item = self.parse(response)
+        with STAGE_SECONDS.labels(self.name, "post_parse").time():
             item = self.post_parse(item)
 
-            if item["title"] is None or item["abstract"] is None:
-                logging.warning(f"Empty title or abstract: {url}")
+        if item["title"] is None or item["abstract"] is None:
+            logging.warning(f"Empty title or abstract: {url}")
+            ITEMS.labels(self.name, "empty").inc()
+            return []
+        return [(url, item)]
+
+    def run(self, urls: list[str]):
+        """
+        Crawl urls in chunks of ``CRAWL_FLUSH_SIZE``.
+
+        Each chunk is fetched, parsed and committed on its own, together
+        with a checkpoint, so a retried task resumes after the last
+        committed chunk.
+        """
+        start = time.monotonic()
+        key = self.request.id  # None when not run by a worker
+        # failed pages stay leased in the frontier and are retried
+        offset, result, _ = self.crawl_chunks(urls, key)
+        request_embeddings(self, result)
+
+        with self.db as db:
+            clear_checkpoint(db, key)
+            db.commit()
+        if len(urls) > offset:
+            record_latency(
+                self.name, (time.monotonic() - start) / (len(urls) - offset)
+            )
+
+    def backfill(self, year: int) -> None:
+        """
+        Crawl every paper of the conference of a year.
+
+        Progress is checkpointed under ``backfill:<name>:<year>`` and kept
+        once the year is done, so an interrupted backfill resumes and a
+        finished year is not crawled again. Pages are fetched without
+        validators. Those that fail are left to the regular crawls, a
+        listing that fails leaves the whole year to a later run.
+        """
+        key = backfill_key(self.name, year)
+        with self.db as db:
+            if checkpoint_done(db, key):
+                logging.info(f"{self.name} {year} is already backfilled")
+                return
+        try:
+            # a stable order, the checkpoint is an offset into it
+            urls = sorted(set(self.get_urls(year)))
+        except ListingError as e:
+            logging.warning(f"{self.name} {year} listing failed: {e}")
+            return
+        if not urls:
+            logging.warning(f"{self.name} {year} has no papers, retry later")
+            return
+        # validators of the current crawl must not hide past papers
+        _, result, failed = self.crawl_chunks(urls, key, conditional=False)
+        with self.db as db:
+            save_checkpoint(db, key, len(urls), done=True)
+            db.commit()
+        request_embeddings(self, result)
+        logging.info(
+            f"{self.name} {year} backfilled {len(urls) - len(failed)} papers,"
+            f" {len(failed)} failed pages queued for the next crawl"
+        )
+
+    def crawl_chunks(
+        self, urls: list[str], key: Optional[str], conditional: bool = True
+    ) -> tuple[int, UpsertResult, list[str]]:
+        """
+        Crawl and commit urls in chunks, after the checkpoint of ``key``.
+
+        :param conditional: send the validators of the cached responses.
+        :returns: offset the crawl resumed at, the outcome of the upserts,
+            and the urls that could not be fetched.
+        """
+        with self.db as db:
+            offset = load_checkpoint(db, key)
+        if offset:
+            logging.info(f"{self.name} resumes at {offset} of {len(urls)}")
+
+        result = UpsertResult()
+        failed = []
+        for begin in range(offset, len(urls), settings.CRAWL_FLUSH_SIZE):
+            chunk = urls[begin : begin + settings.CRAWL_FLUSH_SIZE]
+            rows, fetched, parsed = self.crawl(chunk, conditional)
+            done = {url for url, _ in fetched}
+            missed = [url for url in chunk if url not in done]
+            result += self.commit_chunk(
+                rows, fetched, key, begin + len(chunk), parsed, missed
+            )
+            failed.extend(missed)
+        return offset, result, failed
+
+    def crawl(
+        self, urls: list[str], conditional: bool = True
+    ) -> tuple[list[tuple[str, PaperType]], list[tuple[str, Page]], set[str]]:
+        """
+        Fetch, archive and parse urls.
+
+        :param conditional: send the validators of the cached responses.
+        :returns: parsed items, every page that was fetched, and the urls
+            of the pages that are unchanged or gave items.
+        """
+        rows = []
+        fetched = []
+        parsed = set()
+        responses = self._request_many(urls, conditional)
+        for url, response in zip(urls, responses):
+            if response is None:
                 continue
+            fetched.append((url, response))
+            if response.status == 304:
+                parsed.add(url)
+                continue
+            if self.archive is not None:
+                self.archive.put(self.name, url, response.body)
+            items = self.parse_items(url, response)
+            if items:
+                parsed.add(url)
+            rows.extend(items)
+        return rows, fetched, parsed
+
+    def commit_chunk(
+        self,
+        rows: list[tuple[str, PaperType]],
+        fetched: list[tuple[str, Page]],
+        key: Optional[str],
+        offset: int,
+        parsed: Optional[set[str]] = None,
+        failed: Optional[list[str]] = None,
+    ) -> UpsertResult:
+        """
+        Commit the items of a chunk, its next visits and the checkpoint in
+        one transaction.
+
+        Urls that could not be fetched join the frontier of the source, the
+        checkpoint moves past them and the scheduler crawls them later.
+        Those taken from the frontier are already there.
+
+        :param parsed: urls of the fetched pages whose validators are kept,
+            all of them if None. A page that gave no item is fetched in
+            full again, so a fixed parser sees it.
+        """
+        with STAGE_SECONDS.labels(self.name, "save").time(), self.db as db:
+            result = UpsertResult()
+            for batch in batched(rows, settings.SAVE_BATCH_SIZE):
+                result += self.write(db, list(batch), crawled=True)
+            record_crawls(
+                db,
+                self.name,
+                {url: _digest(response) for url, response in fetched},
+            )
+            if failed:
+                add_urls(db, self.name, failed)
+            save_checkpoint(db, key, offset)
+            db.commit()
+        count_items(self.name, result)
+        logging.info(f"{self.name} saved: {result}")
+        # validators only once the pages are safely stored
+        for url, response in fetched:
+            if parsed is None or url in parsed:
+                self.fetcher.remember(url, response)
+        return result
+
+    def archived(self) -> list[tuple[str, str]]:
+        """
+        Archived pages to replay, the latest fetch of every url.
+        """
+        return [] if self.archive is None else self.archive.latest(self.name)
 
-            results.append((url, item))
+    def reparse(self, pages: list[tuple[str, str]]) -> UpsertResult:
+        """
+        Parse archived pages again and save the items, without fetching.
 
-        self.save(results)
+        :param pages: url and archive digest of the pages.
+        """
+        results = []
+        for url, digest in pages:
+            response = Page(url, self.archive.get(digest))
+            results.extend(self.parse_items(url, response))
+        return self.save(results, crawled=False)
 
 
 class RSSTask(Task):
     name: str
     url: str
     ignore_result: bool = True
-    rate_limit = "30/m"
+    fetcher: Fetcher = Fetcher()
+    archive: Optional[PageArchive] = (
+        PageArchive() if settings.ARCHIVE_DIR else None
+    )
+    # requests per second across the cluster, CRAWL_RATE if None
+    crawl_rate: Optional[float] = None
 
     @property
     def db(self):
@@ -169,39 +443,102 @@ class RSSTask(Task):
     def post_parse(self, entry: PaperType) -> PaperType:
         return entry
 
-    def save(self, data: list[PaperType]) -> None:
-        with self.db as db:
-            # update Item table if exists
-            for item in data:
-                try:
-                    db.add(Item(**item, from_source=self.name))
-                    db.commit()
-                except Exception:
-                    db.rollback()
-                    logging.warning(f"Duplicate item: {item['title']}")
-
-                    existing_item = db.exec(
-                        select(Item).where(Item.title == item["title"]),
-                    ).one()
-                    existing_item.category = item["category"]
-                    existing_item.url = item["url"]
-                    existing_item.abstract = item["abstract"]
-                    existing_item.authors = item["authors"]
-                    existing_item.last_updated = datetime.utcnow()
-                    db.add(existing_item)
-                    db.commit()
+    def write(self, db: Session, items: list[PaperType]) -> UpsertResult:
+        """
+        Write items in the transaction of ``db``, commit is up to the caller.
+        """
+        signatures = merge_near_duplicates(db, items)
+        result = upsert_items(db, items, self.name)
+        index_items(db, items, signatures)
+        return result
 
-    def run(self):
-        feed: FeedParserDict = feedparser.parse(self.url)
-        results = []
+    def save(self, data: list[PaperType]) -> UpsertResult:
+        result = UpsertResult()
+        with self.db as db:
+            for rows in batched(data, settings.SAVE_BATCH_SIZE):
+                result += self.write(db, list(rows))
+                db.commit()
+        logging.info(f"{self.name} saved: {result}")
+        request_embeddings(self, result)
+        return result
+
+    def parse_feed(self, body: bytes) -> Iterator[PaperType]:
+        feed: FeedParserDict = feedparser.parse(body)
         for entry in feed.entries:
-            item = self.parse(entry)
-            item = self.post_parse(item)
+            with STAGE_SECONDS.labels(self.name, "parse").time():
+                item = self.parse(entry)
+            with STAGE_SECONDS.labels(self.name, "post_parse").time():
+                item = self.post_parse(item)
 
             if item["title"] is None or item["abstract"] is None:
                 logging.warning(f"Empty title or abstract: {entry.link}")
+                ITEMS.labels(self.name, "empty").inc()
                 continue
 
-            results.append(item)
+            yield item
+
+    def run(self):
+        """
+        Crawl the feed, committing its items in chunks of
+        ``SAVE_BATCH_SIZE`` with a checkpoint, so a retried task resumes
+        after the last committed chunk of the same feed content.
+        """
+        # one request, one token
+        bucket = TokenBucket(
+            self.name, self.crawl_rate or settings.CRAWL_RATE, block=1
+        )
+        response = self.fetcher.fetch(self.url, throttle=bucket.acquire)
+        if response is None:
+            return
+        observe_response(self.name, response)
+        if response.status_code == 304:
+            with self.db as db:
+                record_crawls(db, self.name, {self.url: None})
+                db.commit()
+            return
+        if self.archive is not None:
+            self.archive.put(self.name, self.url, response.content)
 
-        self.save(results)
+        digest = hashlib.sha256(response.content).hexdigest()
+        # a changed feed starts over, its entries may have moved
+        key = None if self.request.id is None else f"{self.request.id}:{digest}"
+        with self.db as db:
+            offset = load_checkpoint(db, key)
+
+        result = UpsertResult()
+        items = islice(self.parse_feed(response.content), offset, None)
+        for chunk in batched(items, settings.SAVE_BATCH_SIZE):
+            offset += len(chunk)
+            with STAGE_SECONDS.labels(self.name, "save").time(), self.db as db:
+                result += self.write(db, list(chunk))
+                save_checkpoint(db, key, offset)
+                db.commit()
+        count_items(self.name, result)
+        logging.info(f"{self.name} saved: {result}")
+        request_embeddings(self, result)
+
+        if result.inserted or result.updated or result.unchanged:
+            self.fetcher.remember(self.url, response)
+        with self.db as db:
+            record_crawls(db, self.name, {self.url: digest})
+            clear_checkpoint(db, key)
+            db.commit()
+
+    def archived(self) -> list[tuple[str, str]]:
+        """
+        Archived feeds to replay, every distinct snapshot of the feed.
+        """
+        if self.archive is None:
+            return []
+        return self.archive.snapshots(self.name)
+
+    def reparse(self, feeds: list[tuple[str, str]]) -> UpsertResult:
+        """
+        Parse archived feeds again and save the items, without fetching.
+
+        :param feeds: url and archive digest of the feed snapshots.
+        """
+        results = []
+        for _, digest in feeds:
+            results.extend(self.parse_feed(self.archive.get(digest)))
+        return self.save(results)
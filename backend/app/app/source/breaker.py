@@ -0,0 +1,65 @@
+import logging
+import time
+from typing import Optional
+
+from app.core.config import settings
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker of a worker process.
+
+    After ``threshold`` consecutive failures the circuit of a host opens and
+    its requests are skipped for ``cooldown`` seconds. Then a single trial
+    request is let through while the others are still skipped. Its failure
+    opens the circuit for another cool-down, its success closes it. A trial
+    that never reports back, e.g. cancelled by a deadline, expires after
+    another cool-down.
+    """
+
+    def __init__(
+        self, threshold: Optional[int] = None, cooldown: Optional[float] = None
+    ):
+        self.threshold = threshold or settings.BREAKER_THRESHOLD
+        self.cooldown = cooldown or settings.BREAKER_COOLDOWN
+        self._failures: dict[str, int] = {}
+        self._opened: dict[str, float] = {}
+        # start of the trial request of half-open circuits
+        self._trials: dict[str, float] = {}
+
+    def _cooling(self, host: str, now: float) -> bool:
+        opened = self._opened.get(host)
+        return opened is not None and now - opened < self.cooldown
+
+    def allow(self, host: str) -> bool:
+        """
+        Whether a request to the host may be sent, a granted request of a
+        half-open circuit is its trial.
+        """
+        if host not in self._opened:
+            return True
+        now = time.monotonic()
+        if self._cooling(host, now):
+            return False
+        trial = self._trials.get(host)
+        if trial is not None and now - trial < self.cooldown:
+            return False
+        self._trials[host] = now
+        return True
+
+    def success(self, host: str) -> None:
+        if self._opened.pop(host, None) is not None:
+            logging.info(f"Circuit of {host} closed")
+        self._trials.pop(host, None)
+        self._failures.pop(host, None)
+
+    def failure(self, host: str) -> None:
+        self._failures[host] = self._failures.get(host, 0) + 1
+        self._trials.pop(host, None)
+        if self._failures[host] >= self.threshold:
+            now = time.monotonic()
+            if not self._cooling(host, now):
+                logging.warning(
+                    f"Circuit of {host} opened for {self.cooldown:.0f}s"
+                )
+            self._opened[host] = now
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.core.files import replacing
+
+VALIDATORS = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
+
+
+class HttpCache:
+    """
+    On-disk store of HTTP validators used for conditional requests.
+
+    Each url has a small JSON file holding its ETag and Last-Modified
+    headers. A file is touched whenever it is used. Once the directory
+    grows past ``max_bytes``, the least recently used files are evicted.
+    """
+
+    def __init__(
+        self, root: Optional[str] = None, max_bytes: Optional[int] = None
+    ):
+        self.root = Path(root or settings.HTTP_CACHE_DIR)
+        self.max_bytes = max_bytes or settings.HTTP_CACHE_MAX_BYTES
+        # estimated size of the directory, scanned on first write
+        self._size: Optional[int] = None
+
+    def _path(self, url: str) -> Path:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.root / key[:2] / f"{key}.json"
+
+    def headers(self, url: str) -> dict[str, str]:
+        """
+        Conditional request headers for a url, empty if it is not cached.
+        """
+        path = self._path(url)
+        try:
+            validators = json.loads(path.read_text())
+            os.utime(path)
+        except (OSError, ValueError):
+            return {}
+        return {
+            VALIDATORS[name]: value
+            for name, value in validators.items()
+            if name in VALIDATORS
+        }
+
+    def store(self, url: str, headers: Mapping) -> None:
+        """
+        Remember the validators of a response.
+
+        The cache is best effort, a failed write is logged and the next
+        request is sent unconditionally.
+
+        :param url: requested url.
+        :param headers: response headers.
+        """
+        validators = {}
+        for name in VALIDATORS:
+            value = headers.get(name)
+            if isinstance(value, bytes):
+                value = value.decode("latin-1")
+            if value:
+                validators[name] = value
+        if not validators:
+            return
+
+        path = self._path(url)
+        data = json.dumps(validators)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write then rename, concurrent readers never see a partial file
+            with replacing(path) as f:
+                f.write(data)
+        except OSError as e:
+            logging.warning(f"Cannot cache validators of {url}: {e}")
+            return
+
+        if self._size is None:
+            self._size = self._scan_size()
+        self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(entry[1] for entry in self._entries())
+
+    def evict(self) -> None:
+        """
+        Delete least recently used entries down to 90% of ``max_bytes``.
+        """
+        entries = sorted(self._entries())
+
+        size = sum(entry[1] for entry in entries)
+        target = self.max_bytes * 0.9
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+        self._size = size
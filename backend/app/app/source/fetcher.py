@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import os
+import random
+from collections import defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.source.breaker import CircuitBreaker
+from app.source.cache import HttpCache
+
+# awaited before every request, e.g. ``TokenBucket.acquire``
+Throttle = Callable[[], Awaitable[None]]
+# responses worth retrying, the origin is overloaded or failing
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class Fetcher:
+    """
+    Concurrent HTTP fetcher used by the source tasks.
+
+    Requests run on an event loop kept for the life of the process, with
+    one pooled ``httpx.AsyncClient``, so connections to the same site are
+    kept alive and reused across batches and listing requests. Semaphores
+    bound the number of requests in flight per host and in total. A fetcher
+    serves one thread, as in the prefork Celery pool.
+
+    With a cache, requests carry the validators of the last stored response
+    and an unchanged page comes back as a bodiless 304 response. Callers
+    store the validators once the page has been processed.
+
+    Every request has a deadline and so has the whole batch. Transport
+    errors and overloaded responses are retried with jittered exponential
+    backoff, and hosts that keep failing are skipped by a circuit breaker.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        per_host_concurrency: Optional[int] = None,
+        keepalive: Optional[int] = None,
+        cache: Optional[HttpCache] = None,
+        timeout: Optional[float] = None,
+        batch_timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.concurrency = concurrency or settings.REQUESTS_CONCURRENCY
+        self.per_host_concurrency = (
+            per_host_concurrency or settings.REQUESTS_PER_HOST_CONCURRENCY
+        )
+        self.keepalive = keepalive or settings.REQUESTS_KEEPALIVE
+        if cache is None and settings.HTTP_CACHE_DIR:
+            cache = HttpCache()
+        self.cache = cache
+        self.timeout = timeout or settings.REQUESTS_TIMEOUT
+        self.batch_timeout = batch_timeout or settings.REQUESTS_BATCH_TIMEOUT
+        self.retries = settings.REQUESTS_RETRIES if retries is None else retries
+        self.breaker = breaker or CircuitBreaker()
+        # created in the process that fetches, not in a parent that forks
+        self._pid: Optional[int] = None
+        self._runner: Optional[asyncio.Runner] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def client(self) -> httpx.AsyncClient:
+        """
+        Pooled client sized to the concurrency limits.
+        """
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.keepalive,
+            ),
+            timeout=self.timeout,
+            follow_redirects=True,
+        )
+
+    def _run(self, coro):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._runner = asyncio.Runner()
+            self._client = None
+        return self._runner.run(coro)
+
+    def close(self) -> None:
+        """
+        Close the pooled connections and the event loop.
+        """
+        if self._runner is not None and self._pid == os.getpid():
+            if self._client is not None:
+                self._runner.run(self._client.aclose())
+            self._runner.close()
+        self._pid = self._runner = self._client = None
+
+    @staticmethod
+    def backoff(attempt: int, response: Optional[httpx.Response]) -> float:
+        """
+        Seconds to wait before retrying, full jitter over an exponential cap.
+
+        A numeric ``Retry-After`` of the response is honoured.
+
+        :param attempt: number of the failed attempt, from 0.
+        :param response: failed response, None on transport errors.
+        """
+        cap = min(
+            settings.REQUESTS_BACKOFF_MAX,
+            settings.REQUESTS_BACKOFF * 2**attempt,
+        )
+        wait = random.uniform(0, cap)
+        retry_after = (
+            None if response is None else response.headers.get("Retry-After")
+        )
+        if retry_after is not None and retry_after.isdigit():
+            wait = max(
+                wait, min(float(retry_after), settings.REQUESTS_BACKOFF_MAX)
+            )
+        return wait
+
+    async def _request(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        host: str,
+        throttle: Optional[Throttle],
+        headers: dict[str, str],
+        stream: bool = False,
+    ) -> Optional[httpx.Response]:
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow(host):
+                logging.warning(f"Circuit of {host} is open, skip {url}")
+                return None
+            if throttle is not None:
+                await throttle()
+            response = None
+            try:
+                # httpx times out single reads, this bounds the request
+                async with asyncio.timeout(self.timeout):
+                    response = await client.send(
+                        client.build_request("GET", url, headers=headers),
+                        stream=stream,
+                    )
+            except (httpx.TransportError, TimeoutError) as e:
+                error = repr(e)
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    self.breaker.success(host)
+                    break
+                error = f"{response.status_code} {response.reason_phrase}"
+                await response.aclose()
+
+            self.breaker.failure(host)
+            if attempt < self.retries:
+                wait = self.backoff(attempt, response)
+                logging.warning(f"{error} for {url}, retry in {wait:.1f}s")
+                await asyncio.sleep(wait)
+        else:
+            logging.error(f"{error} for {url}, giving up")
+            return None
+
+        if response.status_code != 304:
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                logging.error(e)
+                await response.aclose()
+                return None
+        return response
+
+    @staticmethod
+    def _host(url: str) -> Optional[str]:
+        try:
+            return httpx.URL(url).host
+        except httpx.InvalidURL as e:
+            logging.error(f"Cannot fetch {url}: {e}")
+            return None
+
+    async def _fetch(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        total: asyncio.Semaphore,
+        hosts: dict[str, asyncio.Semaphore],
+        throttle: Optional[Throttle],
+        conditional: bool,
+    ) -> Optional[httpx.Response]:
+        host = self._host(url)
+        if host is None:
+            return None
+        async with total, hosts[host]:
+            headers = {}
+            if conditional and self.cache is not None:
+                headers = self.cache.headers(url)
+            return await self._request(client, url, host, throttle, headers)
+
+    async def _fetch_all(
+        self,
+        urls: list[str],
+        throttle: Optional[Throttle],
+        conditional: bool,
+    ) -> list[Optional[httpx.Response]]:
+        # semaphores are bound to the running loop, so build them per batch
+        total = asyncio.Semaphore(self.concurrency)
+        hosts: dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.per_host_concurrency)
+        )
+        if self._client is None:
+            self._client = self.client()
+        tasks = [
+            asyncio.create_task(
+                self._fetch(
+                    self._client, url, total, hosts, throttle, conditional
+                )
+            )
+            for url in urls
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=self.batch_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            logging.error(
+                f"{len(pending)} of {len(urls)} requests missed the"
+                f" {self.batch_timeout:.0f}s batch deadline"
+            )
+        return [task.result() if task in done else None for task in tasks]
+
+    def fetch_all(
+        self,
+        urls: list[str],
+        throttle: Optional[Throttle] = None,
+        conditional: bool = True,
+    ) -> list[Optional[httpx.Response]]:
+        """
+        Fetch urls concurrently.
+
+        :param urls: urls to fetch.
+        :param throttle: coroutine awaited before every request.
+        :param conditional: send the stored validators, so unchanged pages
+            come back as 304.
+        :returns: responses in the order of ``urls``, None for failures and
+            requests cut by the batch deadline, 304 responses for pages
+            unchanged since their validators were stored.
+        """
+        if not urls:
+            return []
+        return self._run(self._fetch_all(urls, throttle, conditional))
+
+    def fetch(
+        self,
+        url: str,
+        throttle: Optional[Throttle] = None,
+        conditional: bool = True,
+    ) -> Optional[httpx.Response]:
+        return self.fetch_all([url], throttle, conditional)[0]
+
+    async def _stream(
+        self,
+        url: str,
+        throttle: Optional[Throttle],
+        chunk_size: int,
+    ) -> AsyncIterator[bytes]:
+        host = self._host(url)
+        if host is None:
+            return
+        if self._client is None:
+            self._client = self.client()
+        # the whole response, body included, shares the batch deadline
+        deadline = asyncio.get_running_loop().time() + self.batch_timeout
+        try:
+            async with asyncio.timeout_at(deadline):
+                response = await self._request(
+                    self._client, url, host, throttle, {}, stream=True
+                )
+        except TimeoutError:
+            logging.error(
+                f"{url} missed the {self.batch_timeout:.0f}s deadline"
+            )
+            return
+        if response is None:
+            return
+        chunks = response.aiter_bytes(chunk_size)
+        try:
+            while True:
+                try:
+                    async with asyncio.timeout_at(deadline):
+                        chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        except (httpx.TransportError, TimeoutError) as e:
+            logging.error(f"{e!r} for {url}, body cut short")
+            self.breaker.failure(host)
+        finally:
+            await response.aclose()
+
+    def stream(
+        self,
+        url: str,
+        throttle: Optional[Callable[[], None]] = None,
+        chunk_size: int = 64 * 1024,
+    ) -> Iterator[bytes]:
+        """
+        Fetch a url and yield its body in chunks as they arrive, so large
+        responses are never held in memory.
+
+        The request is retried and guarded by the circuit breaker like any
+        other, and the whole response must arrive within the batch deadline.
+        A failed request yields nothing, a failure while reading the body
+        ends it early.
+
+        :param url: url to fetch.
+        :param throttle: function called before every attempt.
+        :param chunk_size: bytes per chunk.
+        """
+
+        async def acquire() -> None:
+            throttle()
+
+        async def next_chunk() -> bytes:
+            return await body.__anext__()
+
+        body = self._stream(url, throttle and acquire, chunk_size)
+        try:
+            while True:
+                try:
+                    yield self._run(next_chunk())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(body.aclose())
+
+    def remember(self, url: str, response) -> None:
+        """
+        Store the validators of a processed response.
+
+        :param url: requested url.
+        :param response: ``httpx.Response`` or ``Page``.
+        """
+        if self.cache is not None:
+            self.cache.store(url, response.headers)
@@ -0,0 +1,78 @@
+import os
+from typing import Optional
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+
+from app.db.upsert import UpsertResult
+
+FETCH_SECONDS = Histogram(
+    "bemore_fetch_seconds",
+    "Latency of page requests.",
+    ["source"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+RESPONSE_BYTES = Histogram(
+    "bemore_response_bytes",
+    "Size of response bodies.",
+    ["source"],
+    buckets=(1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 1e7),
+)
+STAGE_SECONDS = Histogram(
+    "bemore_stage_seconds",
+    "Time spent per crawl stage: parse and post_parse per page, save per "
+    "task.",
+    ["source", "stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 120),
+)
+ITEMS = Counter(
+    "bemore_items",
+    "Crawled items by outcome: inserted, updated, unchanged (duplicate) or "
+    "empty (no title or abstract).",
+    ["source", "result"],
+)
+
+
+def observe_response(source: str, response) -> None:
+    """
+    Record latency and size of an ``httpx.Response``.
+    """
+    FETCH_SECONDS.labels(source).observe(response.elapsed.total_seconds())
+    RESPONSE_BYTES.labels(source).observe(len(response.content))
+
+
+def count_items(source: str, result: UpsertResult) -> None:
+    """
+    Record the outcome of an upsert.
+    """
+    ITEMS.labels(source, "inserted").inc(result.inserted)
+    ITEMS.labels(source, "updated").inc(result.updated)
+    ITEMS.labels(source, "unchanged").inc(result.unchanged)
+
+
+def serve(port: int) -> None:
+    """
+    Export the metrics in Prometheus text format over HTTP.
+
+    When ``PROMETHEUS_MULTIPROC_DIR`` is set, the metrics of every process
+    of the worker pool are aggregated from that directory.
+    """
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+
+
+def mark_process_dead(pid: Optional[int]) -> None:
+    """
+    Tell the multiprocess collector that a pool process has exited.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ and pid is not None:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,91 @@
+import json
+from collections.abc import Mapping
+from functools import cache
+from typing import Any, Optional, Union
+
+from lxml import etree, html
+from parsel.csstranslator import HTMLTranslator
+
+_translator = HTMLTranslator()
+_parser = html.HTMLParser(encoding="utf-8", recover=True)
+
+
+@cache
+def compile_css(query: str) -> etree.XPath:
+    """
+    Compile a CSS selector to an XPath evaluator, once per process.
+
+    Besides plain CSS, the ``::text`` and ``::attr(name)`` pseudo-elements
+    of scrapy/parsel are supported.
+
+    :param query: CSS selector.
+    """
+    return etree.XPath(_translator.css_to_xpath(query), smart_strings=False)
+
+
+class Selection(list):
+    """
+    Results of a selector, strings for text and attributes, else elements.
+    """
+
+    @staticmethod
+    def _serialize(value) -> str:
+        if isinstance(value, str):
+            return value
+        return etree.tostring(value, encoding="unicode", method="html")
+
+    def get(self, default: Optional[str] = None) -> Optional[str]:
+        """
+        First result, or ``default`` if nothing matched.
+        """
+        return self._serialize(self[0]) if self else default
+
+    def getall(self) -> list[str]:
+        """
+        All results.
+        """
+        return [self._serialize(value) for value in self]
+
+
+class Page:
+    """
+    Fetched HTML page queried with CSS selectors, or a JSON document.
+
+    The document is parsed by lxml on first use, selectors are compiled
+    once and reused across pages.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        body: Union[bytes, str],
+        headers: Optional[Mapping] = None,
+        status: int = 200,
+    ):
+        self.url = url
+        self.body = body.encode() if isinstance(body, str) else body
+        self.headers = headers or {}
+        self.status = status
+        self._root = None
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+    @property
+    def root(self):
+        if self._root is None:
+            body = self.body if self.body.strip() else b"<html></html>"
+            self._root = html.document_fromstring(body, parser=_parser)
+        return self._root
+
+    def css(self, query: str) -> Selection:
+        """
+        Select nodes, text or attributes of the page.
+
+        :param query: CSS selector.
+        """
+        return Selection(compile_css(query)(self.root))
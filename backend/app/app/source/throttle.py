@@ -0,0 +1,150 @@
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.models import CrawlBucket
+
+# refill from the elapsed database time, the clocks of the workers may drift
+REFILL = text(
+    """
+    UPDATE crawlbucket SET
+        tokens = LEAST(
+            :burst,
+            tokens + :rate * EXTRACT(
+                EPOCH FROM (clock_timestamp() AT TIME ZONE 'UTC') - updated_at
+            )
+        ),
+        updated_at = clock_timestamp() AT TIME ZONE 'UTC'
+    WHERE source = :source
+    RETURNING tokens
+    """
+)
+SPEND = text(
+    "UPDATE crawlbucket SET tokens = tokens - :n WHERE source = :source"
+)
+
+
+def _session() -> Session:
+    from app.db.engine import engine
+
+    return Session(engine)
+
+
+def _ensure_bucket(db: Session, source: str, tokens: float) -> None:
+    table = CrawlBucket.__table__  # type: ignore
+    db.execute(
+        insert(table)
+        .values(source=source, tokens=tokens)
+        .on_conflict_do_nothing(index_elements=[table.c.source])
+    )
+
+
+class TokenBucket:
+    """
+    Request budget of a source shared by every worker of the cluster.
+
+    The bucket lives in the ``crawlbucket`` table and is refilled under the
+    row lock, so the rate holds no matter how many workers crawl the source.
+    Tokens are taken from the database in blocks and handed out locally to
+    keep round trips low. A block is never larger than the number of
+    requests the caller is about to send, so no tokens go unused.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        rate: float,
+        burst: Optional[int] = None,
+        block: Optional[int] = None,
+    ):
+        self.source = source
+        self.rate = rate
+        self.burst = burst or settings.CRAWL_BURST
+        self.block = min(
+            block or settings.REQUESTS_PER_HOST_CONCURRENCY, self.burst
+        )
+        self._tokens = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def take(self, n: int) -> float:
+        """
+        Take ``n`` tokens from the shared bucket.
+
+        :param n: number of tokens, at most ``burst``.
+        :returns: 0 if granted, otherwise seconds to wait before retrying.
+        """
+        with _session() as db:
+            _ensure_bucket(db, self.source, self.burst)
+            tokens = db.execute(
+                REFILL,
+                {"burst": self.burst, "rate": self.rate, "source": self.source},
+            ).scalar_one()
+            if tokens >= n:
+                db.execute(SPEND, {"n": n, "source": self.source})
+            db.commit()
+        return 0.0 if tokens >= n else (n - tokens) / self.rate
+
+    async def acquire(self) -> None:
+        """
+        Wait for one token.
+        """
+        # the lock binds to the running loop, create it lazily
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self._tokens == 0:
+                wait = await asyncio.to_thread(self.take, self.block)
+                if wait:
+                    await asyncio.sleep(wait)
+                else:
+                    self._tokens = self.block
+            self._tokens -= 1
+
+    def wait(self) -> None:
+        """
+        Block until one token is taken, for synchronous callers.
+        """
+        while wait := self.take(1):
+            time.sleep(wait)
+
+
+def record_latency(source: str, seconds: float) -> None:
+    """
+    Fold one observation of task wall time per url into the source average.
+
+    :param source: source name.
+    :param seconds: observed seconds per url.
+    """
+    alpha = settings.CRAWL_LATENCY_SMOOTHING
+    table = CrawlBucket.__table__  # type: ignore
+    stmt = insert(table).values(
+        source=source, tokens=settings.CRAWL_BURST, url_latency=seconds
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.source],
+        set_={
+            # the first observation seeds the average
+            "url_latency": func.coalesce(
+                alpha * stmt.excluded.url_latency
+                + (1 - alpha) * table.c.url_latency,
+                stmt.excluded.url_latency,
+            )
+        },
+    )
+    with _session() as db:
+        db.execute(stmt)
+        db.commit()
+
+
+def url_latency(source: str) -> Optional[float]:
+    """
+    Average task wall time per url of a source, None if never observed.
+    """
+    with _session() as db:
+        bucket = db.get(CrawlBucket, source)
+        return None if bucket is None else bucket.url_latency
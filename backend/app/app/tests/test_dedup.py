@@ -0,0 +1,135 @@
+import pytest
+from httpx import AsyncClient
+from sqlmodel import Session, text
+from starlette import status
+
+from app.db.dedup import (
+    duplicate_groups,
+    index_catalog,
+    index_items,
+    merge_items,
+    merge_near_duplicates,
+)
+from app.db.upsert import upsert_items
+
+ABSTRACT = (
+    "we study message passing on sparse graphs and show that a spectral "
+    "bound on the laplacian controls how far node features travel in "
+    "each layer of the network"
+)
+
+
+def save(session: Session, rows: list[dict]) -> None:
+    """
+    Store papers the way the crawler does.
+    """
+    signatures = merge_near_duplicates(session, rows)
+    upsert_items(session, rows, "test")
+    index_items(session, rows, signatures)
+    session.commit()
+
+
+@pytest.fixture(name="cleanup")
+def cleanup_fixture(session: Session):
+    yield
+    session.rollback()
+    session.execute(text("DELETE FROM item WHERE from_source = 'test'"))
+    session.commit()
+
+
+@pytest.mark.anyio
+async def test_delete_indexed_item(
+    client: AsyncClient, session: Session, cleanup: None
+) -> None:
+    """
+    Checks that an item with LSH bands can be deleted.
+
+    :param client: client for the app.
+    :param session: database session.
+    """
+    save(session, [{"title": "Dedup test paper", "abstract": ABSTRACT}])
+    item_id = session.execute(
+        text("SELECT id FROM item WHERE title = 'Dedup test paper'")
+    ).scalar()
+    bands = text("SELECT count(*) FROM itemband WHERE item_id = :id")
+    assert session.execute(bands, {"id": item_id}).scalar() > 0
+
+    response = await client.post(
+        "/api/login/access-token",
+        data={"username": "admin@localhost.com", "password": "admin"},
+    )
+    token = response.json()["access_token"]
+    response = await client.delete(
+        f"/api/items/{item_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert session.execute(bands, {"id": item_id}).scalar() == 0
+
+
+def test_near_duplicate_folds_into_canonical(
+    session: Session, cleanup: None
+) -> None:
+    """
+    Checks that a reworded copy of an indexed paper updates it.
+
+    :param session: database session.
+    """
+    save(session, [{"title": "Dedup test paper", "abstract": ABSTRACT}])
+    rows = [{"title": "Dedup test paper (extended)", "abstract": ABSTRACT}]
+    save(session, rows)
+    assert rows[0]["title"] == "Dedup test paper"
+    titles = session.execute(
+        text("SELECT title FROM item WHERE from_source = 'test'")
+    ).scalars()
+    assert list(titles) == ["Dedup test paper"]
+
+
+def test_merge_moves_feedback(session: Session, cleanup: None) -> None:
+    """
+    Checks that catalog duplicates fold into the oldest item with their
+    feedback.
+
+    :param session: database session.
+    """
+    ids = [
+        session.execute(
+            text(
+                "INSERT INTO item (title, abstract, from_source, is_hidden,"
+                " last_updated) VALUES (:title, :abstract, 'test', false,"
+                " now()) RETURNING id"
+            ),
+            {"title": title, "abstract": ABSTRACT},
+        ).scalar()
+        for title in ("Dedup test paper", "Dedup test paper (extended)")
+    ]
+    user_id = session.execute(
+        text("SELECT id FROM \"user\" WHERE email = 'admin@localhost.com'")
+    ).scalar()
+    session.execute(
+        text(
+            "INSERT INTO feedback (feedback_type, item_id, user_id, timestamp)"
+            " VALUES (1, :item_id, :user_id, now())"
+        ),
+        {"item_id": ids[1], "user_id": user_id},
+    )
+    session.commit()
+    assert index_catalog(session) >= 2
+    canonical = duplicate_groups(session)
+    assert canonical[ids[1]] == ids[0]
+
+    # leave the rest of the test catalog alone
+    merge_items(session, {ids[1]: ids[0]})
+    session.commit()
+    remaining = session.execute(
+        text("SELECT id FROM item WHERE id = ANY(:ids)"), {"ids": ids}
+    ).scalars()
+    assert list(remaining) == [ids[0]]
+    feedback = session.execute(
+        text("SELECT item_id FROM feedback WHERE user_id = :user_id"),
+        {"user_id": user_id},
+    ).scalars()
+    assert ids[0] in list(feedback)
+    session.execute(
+        text("DELETE FROM feedback WHERE item_id = :id"), {"id": ids[0]}
+    )
+    session.commit()
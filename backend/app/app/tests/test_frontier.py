@@ -0,0 +1,77 @@
+import pytest
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.db.frontier import add_urls, lease_due, record_crawls
+
+SOURCE = "frontier-test"
+
+
+@pytest.fixture(name="cleanup")
+def cleanup_fixture(session: Session):
+    yield
+    session.rollback()
+    session.execute(
+        text("DELETE FROM crawlfrontier WHERE source = :source"),
+        {"source": SOURCE},
+    )
+    session.commit()
+
+
+def revisit(session: Session, url: str) -> int:
+    return session.execute(
+        text(
+            "SELECT revisit_seconds FROM crawlfrontier"
+            " WHERE source = :source AND url = :url"
+        ),
+        {"source": SOURCE, "url": url},
+    ).scalar()
+
+
+def test_revisit_interval(session: Session, cleanup: None) -> None:
+    """
+    Checks that unchanged pages are revisited less often and changed
+    pages more often.
+
+    :param session: database session.
+    """
+    assert add_urls(session, SOURCE, ["a", "a", "b"])[0] == 2
+    assert add_urls(session, SOURCE, ["a"])[0] == 0
+    interval = settings.CRAWL_INTERVAL
+    assert settings.CRAWL_MIN_INTERVAL <= interval // 2
+    assert 2 * interval <= settings.CRAWL_MAX_INTERVAL
+
+    # the first crawl keeps the interval
+    record_crawls(session, SOURCE, {"a": "1", "b": "1"})
+    assert revisit(session, "a") == interval
+    record_crawls(session, SOURCE, {"a": "1", "b": "2"})
+    assert revisit(session, "a") == 2 * interval
+    assert revisit(session, "b") == interval // 2
+    # a 304 counts as unchanged
+    record_crawls(session, SOURCE, {"b": None})
+    assert revisit(session, "b") == interval
+
+
+def test_lease_never_crawled_first(session: Session, cleanup: None) -> None:
+    """
+    Checks that new urls are leased before known ones, and leased urls
+    are not due again.
+
+    :param session: database session.
+    """
+    add_urls(session, SOURCE, ["old"])
+    record_crawls(session, SOURCE, {"old": "1"})
+    add_urls(session, SOURCE, ["new"])
+    # both due, the crawled one for longer
+    session.execute(
+        text(
+            "UPDATE crawlfrontier SET next_due = next_due"
+            " - make_interval(days => CASE url WHEN 'old' THEN 30 ELSE 1 END)"
+            " - make_interval(secs => revisit_seconds)"
+            " WHERE source = :source"
+        ),
+        {"source": SOURCE},
+    )
+    assert lease_due(session, SOURCE, limit=1) == ["new"]
+    assert lease_due(session, SOURCE) == ["old"]
+    assert lease_due(session, SOURCE) == []
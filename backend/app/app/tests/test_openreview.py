@@ -0,0 +1,74 @@
+import httpx
+import pytest
+
+from app.source.base import ListingError
+from app.source.OpenReview import OpenReview
+from app.source.selector import Page
+from benchmarks.fixture_server import FixtureServer
+
+
+@pytest.fixture(name="server")
+def server_fixture():
+    server = FixtureServer(papers=25)
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def test_openreview_pages(
+    server: FixtureServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Checks that the notes of a venue are read page by page.
+
+    :param server: local stand-in of the OpenReview api.
+    """
+    monkeypatch.setattr(OpenReview, "page_size", 10)
+    listing = server.source_templates()["OpenReview"].format(year=2021)
+    urls = OpenReview.parse_urls(Page(listing, httpx.get(listing).content))
+    assert len(urls) == 3
+
+    task = OpenReview()
+    rows = []
+    for url in urls:
+        page = Page(url, httpx.get(url).content)
+        rows.extend(task.parse_items(url, page))
+    assert len(rows) == 25
+    assert len({url for url, _ in rows}) == 25
+    url, item = rows[0]
+    assert url == "https://openreview.net/forum?id=ICLR.cc/2021/Conference/0"
+    assert item["title"].startswith("ICLR.cc/2021/Conference note 0")
+    assert item["abstract"]
+    assert item["authors"] == ["Ada Lovelace", "Alan Turing"]
+
+
+def test_openreview_v1_note() -> None:
+    """
+    Checks that notes with plain content values are read too.
+    """
+    item = OpenReview.parse_note(
+        {
+            "forum": "abc",
+            "content": {
+                "title": "A v1 paper",
+                "abstract": "An abstract.",
+                "authors": ["Ada Lovelace"],
+            },
+        }
+    )
+    assert item["title"] == "A v1 paper"
+    assert item["abstract"] == "An abstract."
+    assert item["authors"] == ["Ada Lovelace"]
+    assert item["keywords"] is None
+
+
+def test_openreview_listing_without_count(server: FixtureServer) -> None:
+    """
+    Checks that a listing without the count of notes is an error.
+
+    :param server: local stand-in of the OpenReview api.
+    """
+    listing = server.source_templates()["OpenReview"].format(year=2024)
+    listing = listing.replace("&count=true", "")
+    with pytest.raises(ListingError):
+        OpenReview.parse_urls(Page(listing, httpx.get(listing).content))
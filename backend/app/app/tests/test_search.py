@@ -0,0 +1,133 @@
+import json
+import random
+
+import numpy as np
+import pytest
+from gensim.models.doc2vec import Doc2Vec, TaggedDocument
+from httpx import AsyncClient
+from sqlmodel import Session, text
+from starlette import status
+
+from app.ml.ann import VectorIndex
+from app.ml.doc2vec import ModelStore, tokenize
+from app.ml.vectors import EmbeddingStore
+from app.web.api.endpoints import items
+
+
+@pytest.fixture(name="searchable")
+def searchable_fixture(session: Session, tmp_path, monkeypatch):
+    """
+    Items about graphs or about privacy, embedded by a trained model.
+    """
+    topics = {
+        "graph": "graph node edge message passing neighbourhood vertex "
+        "spectral laplacian walk".split(),
+        "privacy": "privacy differential noise federated client secure "
+        "attack membership leakage budget".split(),
+    }
+    rng = random.Random(0)
+    documents = [
+        (f"search test {topic} item {i}", " ".join(rng.choices(words, k=40)))
+        for topic, words in topics.items()
+        for i in range(50)
+    ]
+    model = Doc2Vec(
+        [
+            TaggedDocument(tokenize(abstract), [i])
+            for i, (_, abstract) in enumerate(documents)
+        ],
+        dm=0,
+        vector_size=8,
+        min_count=1,
+        epochs=40,
+        seed=1,
+        workers=1,
+    )
+    models = ModelStore(str(tmp_path / "models"))
+    version = models.save(model)
+    ids = []
+    for i, (title, abstract) in enumerate(documents):
+        # older arXiv items hold a bare string, newer ones a list
+        category = title.split()[2]
+        ids.append(
+            session.execute(
+                text(
+                    "INSERT INTO item (title, abstract, from_source, is_hidden,"
+                    " last_updated, category, doc2vec, embedding_version)"
+                    " VALUES (:title, :abstract, :source, false, now(),"
+                    " :category, :vector, :version) RETURNING id"
+                ),
+                {
+                    "title": title,
+                    "abstract": abstract,
+                    "source": "even" if i % 2 == 0 else "odd",
+                    "category": json.dumps(
+                        category if i % 4 < 2 else [category]
+                    ),
+                    "vector": model.infer_vector(tokenize(abstract))
+                    .astype(np.float32)
+                    .tobytes(),
+                    "version": version,
+                },
+            ).scalar()
+        )
+    session.commit()
+    store = EmbeddingStore(str(tmp_path / "embeddings"))
+    store.rebuild(session, version)
+    monkeypatch.setattr(items, "model_store", models)
+    monkeypatch.setattr(items, "embedding_store", store)
+    monkeypatch.setattr(
+        items, "vector_index", VectorIndex(str(tmp_path / "ann"))
+    )
+    items.search_ids.cache_clear()
+    yield ids
+    session.execute(text("DELETE FROM item WHERE id = ANY(:ids)"), {"ids": ids})
+    session.commit()
+
+
+@pytest.mark.anyio
+async def test_search_items(client: AsyncClient, searchable: list[int]) -> None:
+    """
+    Checks that items about the query come first and filters apply.
+
+    :param client: client for the app.
+    :param searchable: ids of the graph items, then of the privacy items.
+    """
+    response = await client.get(
+        "/api/items/search", params={"q": "federated privacy", "limit": 5}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert {item["id"] for item in response.json()} <= set(searchable[50:])
+    assert len(response.json()) == 5
+
+    response = await client.get(
+        "/api/items/search",
+        params={"q": "graph", "from_source": "odd", "category": "graph"},
+    )
+    titles = [item["title"] for item in response.json()]
+    assert len(titles) == 10
+    assert all(title.startswith("search test graph") for title in titles)
+    # both shapes of stored categories match
+    assert {int(title.split()[-1]) % 4 for title in titles} == {1, 3}
+    assert items.search_ids.cache_info().currsize == 2
+
+    response = await client.get(
+        "/api/items/search", params={"q": "graph", "limit": 0}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.anyio
+async def test_search_without_model(
+    client: AsyncClient, searchable: list[int], monkeypatch
+) -> None:
+    """
+    Checks that a missing model answers 503 and is not cached.
+
+    :param client: client for the app.
+    :param searchable: ids of the embedded items.
+    """
+    monkeypatch.setattr(items.model_store, "load", lambda *args, **kw: None)
+    response = await client.get("/api/items/search", params={"q": "graph"})
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert items.search_ids.cache_info().currsize == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from httpx import AsyncClient
+from sqlmodel import Session, text
+from starlette import status
+
+from app.ml.ann import VectorIndex
+from app.ml.vectors import EmbeddingStore
+from app.web.api.endpoints import items
+
+
+@pytest.fixture(name="embedded")
+def embedded_fixture(session: Session, tmp_path, monkeypatch):
+    """
+    Items on a circle of doc2vec vectors, neighbours by angle.
+    """
+    angles = np.linspace(0, np.pi, 20)
+    vectors = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    ids = []
+    for i, vector in enumerate(vectors.astype(np.float32)):
+        ids.append(
+            session.execute(
+                text(
+                    "INSERT INTO item (title, abstract, from_source, is_hidden,"
+                    " last_updated, doc2vec, embedding_version)"
+                    " VALUES (:title, '', 'test', :hidden, now(), :vector,"
+                    " 'test') RETURNING id"
+                ),
+                {
+                    "title": f"similar test item {i}",
+                    "hidden": i == 2,
+                    "vector": vector.tobytes(),
+                },
+            ).scalar()
+        )
+    session.commit()
+    store = EmbeddingStore(str(tmp_path / "embeddings"))
+    store.rebuild(session, "test")
+    VectorIndex(str(tmp_path / "ann")).update(store)
+    monkeypatch.setattr(items, "embedding_store", store)
+    monkeypatch.setattr(
+        items, "vector_index", VectorIndex(str(tmp_path / "ann"))
+    )
+    yield ids
+    session.execute(text("DELETE FROM item WHERE id = ANY(:ids)"), {"ids": ids})
+    session.commit()
+
+
+@pytest.mark.anyio
+async def test_similar_items(client: AsyncClient, embedded: list[int]) -> None:
+    """
+    Checks that the closest visible items come first.
+
+    :param client: client for the app.
+    :param embedded: ids of the embedded items, by angle.
+    """
+    response = await client.get(f"/api/items/{embedded[0]}/similar?limit=3")
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["id"] for item in response.json()] == [
+        embedded[1],
+        embedded[3],
+        embedded[4],
+    ]
+
+    response = await client.get("/api/items/0/similar")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,44 @@
+import pytest
+from sqlmodel import Session, text
+
+from app.db.upsert import UpsertResult, upsert_items
+
+
+@pytest.fixture(name="cleanup")
+def cleanup_fixture(session: Session):
+    yield
+    session.rollback()
+    session.execute(
+        text("DELETE FROM item WHERE title LIKE 'Upsert test paper %'")
+    )
+    session.commit()
+
+
+def test_upsert_counts(session: Session, cleanup: None) -> None:
+    """
+    Checks the inserted, updated and unchanged counts of an upsert.
+
+    :param session: database session.
+    """
+    rows = [
+        {"title": f"Upsert test paper {i}", "abstract": f"abstract {i}"}
+        for i in range(3)
+    ]
+    assert upsert_items(session, rows, "test") == UpsertResult(inserted=3)
+    session.commit()
+    changed = [
+        {**rows[0], "abstract": "a new abstract"},
+        # whitespace only, the content is the same
+        {**rows[1], "abstract": "  abstract   1 "},
+        rows[2],
+        {"title": "Upsert test paper 3", "abstract": "abstract 3"},
+    ]
+    assert upsert_items(session, changed, "test") == UpsertResult(
+        inserted=1, updated=1, unchanged=2
+    )
+    session.commit()
+    abstract = session.execute(
+        text("SELECT abstract FROM item WHERE title = :title"),
+        {"title": rows[0]["title"]},
+    ).scalar()
+    assert abstract == "a new abstract"
@@ -1,8 +1,17 @@
-from typing import Any
-
-from fastapi import APIRouter, HTTPException
-from sqlmodel import select
-
+import copy
+import threading
+from functools import lru_cache
+from typing import Any, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from sqlalchemy import cast, literal
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Session, col, select
+
+from app.core.config import settings
+from app.ml.ann import VectorIndex
+from app.ml.doc2vec import ModelStore, tokenize
+from app.ml.vectors import EmbeddingStore
 from app.models import (
     Item,
     ItemCreate,
@@ -12,6 +21,66 @@ from app.models import (
 from app.web.api.deps import CurrentUser, SessionDep
 
 router = APIRouter()
+# mapped once per api process, reloaded when the worker replaces them
+model_store = ModelStore()
+embedding_store = EmbeddingStore()
+vector_index = VectorIndex()
+
+
+def ranked_items(session: Session, ids: list[int], *where) -> list[Item]:
+    """
+    Items in the order of their ids, without those not matching ``where``.
+    """
+    rank = {item_id: i for i, item_id in enumerate(ids)}
+    statement = select(Item).where(col(Item.id).in_(ids), *where)
+    return sorted(session.exec(statement), key=lambda item: rank[item.id])
+
+
+class StoreSnapshot:
+    """
+    The embedding store and its index as one request loaded them, reloads
+    of the shared ones do not change them. Snapshots of the same rows are
+    equal, they key the search cache.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, store: EmbeddingStore, index: VectorIndex):
+        with self._lock:
+            self.store = copy.copy(store.load())
+            self.index = copy.copy(index.load())
+        self.key = (self.store.generation, len(self.store))
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, StoreSnapshot) and self.key == other.key
+
+
+@lru_cache(maxsize=settings.SEARCH_CACHE_SIZE)
+def search_ids(query: str, snapshot: StoreSnapshot) -> tuple[int, ...]:
+    """
+    Items closest to a query, ``SEARCH_CANDIDATES`` of them, best first.
+
+    The query is embedded with the model of the store vectors. A result is
+    not reused once the worker changed the store.
+    """
+    store = snapshot.store
+    loaded = model_store.load(store.version, mmap="r")
+    if loaded is None:
+        # not cached, the model of a new store may still be on its way
+        raise HTTPException(status_code=503, detail="Search model missing")
+    tokens = tokenize(query)
+    if not tokens:
+        return ()
+    _, model = loaded
+    ids, _ = snapshot.index.search(
+        store,
+        model.infer_vector(tokens, epochs=settings.SEARCH_EPOCHS),
+        settings.SEARCH_CANDIDATES,
+    )
+    return tuple(ids.tolist())
 
 
 @router.get("/", response_model=list[ItemOut])
@@ -27,6 +96,38 @@ def read_items(
     return session.exec(statement).all()
 
 
+@router.get("/search", response_model=list[ItemOut])
+def search_items(
+    session: SessionDep,
+    q: str,
+    from_source: Optional[str] = None,
+    category: Optional[str] = None,
+    is_hidden: Optional[bool] = False,
+    limit: int = Query(10, ge=1, le=100),
+) -> Any:
+    """
+    Search items by topic, closest abstracts first.
+
+    Only the ``SEARCH_CANDIDATES`` closest items are filtered, a rare
+    source or category may return fewer than ``limit`` items.
+    """
+    snapshot = StoreSnapshot(embedding_store, vector_index)
+    if snapshot.store.generation is None:
+        raise HTTPException(status_code=503, detail="Items not embedded yet")
+    ids = search_ids(q.strip().lower(), snapshot)
+    where = []
+    if from_source is not None:
+        where.append(col(Item.from_source) == from_source)
+    if category is not None:
+        # a scalar is contained in an array holding it and in itself, older
+        # arXiv items store their category as a bare string
+        category_json = cast(Item.category, JSONB)
+        where.append(category_json.contains(literal(category, JSONB)))
+    if is_hidden is not None:
+        where.append(col(Item.is_hidden).is_(is_hidden))
+    return ranked_items(session, list(ids), *where)[:limit]
+
+
 @router.get("/{id}", response_model=ItemOut)
 def read_item(session: SessionDep, id: int) -> Any:
     """
@@ -38,6 +139,31 @@ def read_item(session: SessionDep, id: int) -> Any:
     return item
 
 
+@router.get("/{id}/similar", response_model=list[ItemOut])
+def read_similar_items(
+    session: SessionDep, id: int, limit: int = Query(10, ge=1, le=100)
+) -> Any:
+    """
+    Get the items closest to an item by doc2vec similarity, best first.
+    """
+    item = Item.one_by_id(session, id=id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    snapshot = StoreSnapshot(embedding_store, vector_index)
+    store = snapshot.store
+    found, vectors = store.get([id])
+    if not len(found):
+        raise HTTPException(status_code=404, detail="Item not embedded yet")
+    # room for the item itself and for hidden or deleted neighbours
+    ids, _ = snapshot.index.search(store, vectors[0], 2 * limit + 1)
+    items = ranked_items(
+        session,
+        [other for other in ids.tolist() if other != id],
+        col(Item.is_hidden).is_(False),
+    )
+    return items[:limit]
+
+
 @router.get("/fuzzy/{title}", response_model=list[ItemOut])
 def read_item_fuzzy(session: SessionDep, title: str) -> Any:
     """
@@ -3,11 +3,16 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from pydantic.networks import EmailStr
 
+from app.core.celery_app import celery_app
 from app.models import Message
+from app.source.base import PaperRequestsTask
 from app.utils import send_test_email
 from app.web.api.deps import CurrentUser, get_current_active_superuser
 from app.worker import (
+    backfill,
+    dedup_items,
     paper_crawler,
+    reparse,
     send_recommendation_email,
     train_doc2vec,
     train_recommender,
@@ -56,6 +61,56 @@ def test_celery() -> TaskOut:
     return _to_task_out(task)
 
 
+@router.post(
+    "/reparse",
+    dependencies=[Depends(get_current_active_superuser)],
+    status_code=201,
+)
+def reparse_source(name: str) -> TaskOut:
+    """
+    Re-extract the items of a source from its page archive.
+    """
+    task = reparse.delay(name)
+    return _to_task_out(task)
+
+
+@router.post(
+    "/backfill",
+    dependencies=[Depends(get_current_active_superuser)],
+    status_code=201,
+)
+def backfill_source(
+    name: str, first_year: int, last_year: int, restart: bool = False
+) -> TaskOut:
+    """
+    Crawl past years of a conference, resuming an interrupted backfill.
+    """
+    task = celery_app.tasks.get(name)
+    if not isinstance(task, PaperRequestsTask) or task.url_template is None:
+        raise HTTPException(
+            status_code=400, detail=f"{name} cannot be backfilled"
+        )
+    if first_year > last_year:
+        raise HTTPException(
+            status_code=400, detail="first_year is after last_year"
+        )
+    result = backfill.delay(name, first_year, last_year, restart)
+    return _to_task_out(result)
+
+
+@router.post(
+    "/dedup",
+    dependencies=[Depends(get_current_active_superuser)],
+    status_code=201,
+)
+def dedup() -> TaskOut:
+    """
+    Merge near-duplicate items of the catalog.
+    """
+    task = dedup_items.delay()
+    return _to_task_out(task)
+
+
 @router.get(
     "/test-doc2vec",
     dependencies=[Depends(get_current_active_superuser)],
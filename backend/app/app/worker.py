@@ -1,19 +1,17 @@
-import collections
 import inspect
+import math
 import os
-import random
-from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Union
 
 import gensim
 import numpy as np
 import pandas as pd
-from celery import Task
+from celery import Task, group
+from celery.signals import worker_init, worker_process_shutdown
 from celery.utils.log import get_task_logger
-from gensim.models.doc2vec import TaggedDocument
 from implicit.als import AlternatingLeastSquares
-from pandas import DataFrame, Series
+from pandas import DataFrame
 from rectools import Columns
 from rectools.dataset import Dataset
 from rectools.metrics import MAP, MeanInvUserFreq, Serendipity, calc_metrics
@@ -23,22 +21,52 @@ from sqlmodel import Session, col, select
 from app import source
 from app.core.celery_app import celery_app
 from app.core.config import settings
-from app.models import CrawledItem, FeedBack, Item, User
-from app.source.base import PaperRequestsTask
+from app.db.checkpoint import clear_backfill, clear_stale_checkpoints
+from app.db.dedup import duplicate_groups, index_catalog, merge_items
+from app.db.embedding import (
+    any_stale,
+    infer_stale,
+    lock_planning,
+    stale_shards,
+)
+from app.db.frontier import add_urls, lease_due, record_crawls
+from app.ml.ann import VectorIndex
+from app.ml.corpus import Corpus, sample_items
+from app.ml.doc2vec import ModelStore, evaluate
+from app.ml.tokens import TokenCache
+from app.ml.vectors import EmbeddingStore
+from app.models import FeedBack, Item, User
+from app.source import metrics
+from app.source.base import ListingError, PaperRequestsTask
+from app.source.throttle import url_latency
 from app.utils import get_recommend_block, send_email
 
 os.environ["OPENBLAS_NUM_THREADS"] = "1"  # For implicit ALS
 logger = get_task_logger(__name__)
+model_store = ModelStore()
+token_cache = TokenCache()
+embedding_store = EmbeddingStore()
+vector_index = VectorIndex()
 
 
 @celery_app.on_after_configure.connect  # type: ignore
 def setup_periodic_tasks(sender, **kwargs):
-    # sender.add_periodic_task(
-    #     crontab(minute="10"),
-    #     paper_crawler.s(),
-    #     name="crawl papers",
-    # )
-    pass
+    sender.add_periodic_task(
+        settings.CRAWL_SCHEDULE_INTERVAL,
+        paper_crawler.s(),
+        name="crawl due pages",
+    )
+
+
+@worker_init.connect  # type: ignore
+def start_metrics_exporter(**kwargs):
+    if settings.METRICS_PORT:
+        metrics.serve(settings.METRICS_PORT)
+
+
+@worker_process_shutdown.connect  # type: ignore
+def mark_process_dead(pid=None, **kwargs):
+    metrics.mark_process_dead(pid)
 
 
 members = inspect.getmembers(source, inspect.isclass)
@@ -72,6 +100,58 @@ class DatabaseTask(Task):
         return Session(engine)
 
 
+def queue_depth(queue: str = "celery") -> int:
+    """
+    Number of messages waiting in a broker queue, 0 if unknown.
+
+    :param queue: queue name.
+    """
+    try:
+        with celery_app.connection_for_read() as connection:
+            return connection.default_channel.queue_declare(
+                queue=queue, passive=True
+            ).message_count
+    except Exception as e:
+        logger.warning(f"Cannot read the depth of queue {queue}: {e}")
+        return 0
+
+
+def worker_slots() -> int:
+    """
+    Number of concurrent task slots over all running workers, at least 1.
+    """
+    try:
+        stats = celery_app.control.inspect(timeout=1.0).stats() or {}
+    except Exception as e:
+        logger.warning(f"Cannot inspect the workers: {e}")
+        stats = {}
+    return max(
+        1,
+        sum(
+            worker.get("pool", {}).get("max-concurrency", 1)
+            for worker in stats.values()
+        ),
+    )
+
+
+def crawl_chunk_size(n_urls: int, slots: int, depth: int, latency: float):
+    """
+    Number of urls sent to one crawl task.
+
+    The urls are spread over all worker slots. A deep queue means the slots
+    are busy anyway, so fewer and larger messages are sent. The observed
+    latency per url keeps a task within ``CRAWL_TASK_SECONDS``.
+
+    :param n_urls: number of urls to crawl.
+    :param slots: concurrent task slots of the workers.
+    :param depth: messages waiting in the queue.
+    :param latency: seconds per url of the source.
+    """
+    size = math.ceil(n_urls / slots * (1 + depth / slots))
+    size = min(size, int(settings.CRAWL_TASK_SECONDS / latency))
+    return max(settings.CRAWL_MIN_CHUNK, min(size, settings.CRAWL_MAX_CHUNK))
+
+
 @celery_app.task(
     acks_late=True,
     base=DatabaseTask,
@@ -80,35 +160,169 @@ class DatabaseTask(Task):
 )
 def paper_crawler(self: DatabaseTask) -> None:
     """
-    Celery task to crawl papers from arxiv.
+    Celery task to enqueue the crawls that are due.
+
+    The listing of a source is fetched only when it is due, new urls join
+    the frontier and are crawled first. Known pages are crawled again once
+    their revisit interval has passed.
     """
+    slots, depth = worker_slots(), queue_depth()
+    with self.db as db:
+        clear_stale_checkpoints(db, settings.CRAWL_CHECKPOINT_TTL)
+        db.commit()
     for name, _class in members:
-        if issubclass(_class, PaperRequestsTask):
-            urls = _class.get_urls()
-            # duplicate urls
-            urls = list(set(urls))
-            # duplicate usls from db
-            with self.db as db:  # noqa: WPS440
-                crawled_urls = db.exec(
-                    select(CrawledItem).where(
-                        (CrawledItem.last_crawled - datetime.now())
-                        <= timedelta(days=7)
-                    )
-                )
-                crawled_urls = [item.raw_url for item in crawled_urls]
-            urls = list(set(urls) - set(crawled_urls))
-            if len(urls) > settings.REQUESTS_BATCH_SIZE:
-                for batch_urls in batch(urls, settings.REQUESTS_BATCH_SIZE):
-                    logger.info(
-                        f"Start crawling {name} with {len(batch_urls)} urls"
+        with self.db as db:  # noqa: WPS440
+            add_urls(db, name, [_class.url], listing=True)
+            listing_due = bool(lease_due(db, name, listing=True))
+            db.commit()
+        if not issubclass(_class, PaperRequestsTask):
+            if listing_due:
+                logger.info(f"Start crawling {name}")
+                celery_app.signature(name).apply_async()
+            continue
+
+        listing = None
+        with self.db as db:  # noqa: WPS440
+            if listing_due:
+                try:
+                    listed, listing = _class.changed_urls()
+                    new, digest = add_urls(db, name, listed)
+                except ListingError as e:
+                    # not recorded, the lease runs out and it is tried again
+                    logger.warning(f"Listing of {name} failed: {e}")
+                    db.rollback()
+                    listing = None
+                else:
+                    # a listing with new urls has changed
+                    record_crawls(
+                        db, name, {_class.url: digest if new else None}
                     )
-                    celery_app.send_task(name, args=[batch_urls])
-            else:
-                logger.info(f"Start crawling {name} with {len(urls)} urls")
-                celery_app.send_task(name, args=[urls])
-        else:
-            logger.info(f"Start crawling {name}")
-            celery_app.send_task(name)
+                    logger.info(f"Found {new} new urls of {name}")
+            urls = lease_due(db, name)
+            db.commit()
+        # only once its urls are stored, a listing without urls is fetched
+        # in full again
+        if listing is not None and listed:
+            _class.fetcher.remember(_class.url, listing)
+        if not urls:
+            continue
+        latency = url_latency(name) or settings.CRAWL_DEFAULT_LATENCY
+        chunks = list(
+            batch(urls, crawl_chunk_size(len(urls), slots, depth, latency))
+        )
+        logger.info(
+            f"Start crawling {name} with {len(urls)} urls"
+            f" in {len(chunks)} tasks"
+        )
+        group(
+            celery_app.signature(name, args=[chunk]) for chunk in chunks
+        ).apply_async()
+
+
+@celery_app.task(
+    acks_late=True,
+    base=DatabaseTask,
+    bind=True,
+    ignore_result=True,
+)
+def backfill(
+    self: DatabaseTask,
+    name: str,
+    first_year: int,
+    last_year: int,
+    restart: bool = False,
+) -> None:
+    """
+    Celery task to crawl past years of a conference.
+
+    Every year is crawled by its own task, in parallel over the workers.
+    Years already backfilled are skipped and interrupted years resume from
+    their checkpoint, unless the backfill restarts.
+
+    Args:
+        name (str): The source name.
+        first_year (int): The first year to crawl.
+        last_year (int): The last year to crawl, included.
+        restart (bool): Crawl every year again from the start.
+    """
+    years = range(first_year, last_year + 1)
+    if restart:
+        with self.db as db:
+            clear_backfill(db, name, years)
+            db.commit()
+    logger.info(f"Start backfilling {name} from {first_year} to {last_year}")
+    group(backfill_year.s(name, year) for year in years).apply_async()
+
+
+@celery_app.task(acks_late=True, ignore_result=True)
+def backfill_year(name: str, year: int) -> None:
+    """
+    Celery task to crawl the conference of a year.
+
+    Args:
+        name (str): The source name.
+        year (int): The conference year.
+    """
+    celery_app.tasks[name].backfill(year)
+
+
+@celery_app.task(
+    acks_late=True,
+    base=DatabaseTask,
+    bind=True,
+    ignore_result=True,
+)
+def reparse(self: DatabaseTask, name: str) -> None:
+    """
+    Celery task to extract the items of a source again from its archive.
+
+    The archived pages are split into shards that the workers parse in
+    parallel, nothing is fetched from the origin.
+
+    Args:
+        name (str): The source name.
+    """
+    pages = celery_app.tasks[name].archived()
+    shards = list(batch(pages, settings.REPARSE_SHARD_SIZE))
+    logger.info(f"Start reparsing {name} with {len(pages)} pages")
+    group(reparse_shard.s(name, shard) for shard in shards).apply_async()
+
+
+@celery_app.task(acks_late=True, ignore_result=True)
+def reparse_shard(name: str, pages: list[tuple[str, str]]) -> None:
+    """
+    Celery task to parse a shard of archived pages of a source.
+
+    Args:
+        name (str): The source name.
+        pages (list): Url and archive digest of the pages.
+    """
+    result = celery_app.tasks[name].reparse(pages)
+    logger.info(f"Reparsed {len(pages)} pages of {name}: {result}")
+
+
+@celery_app.task(
+    acks_late=True,
+    base=DatabaseTask,
+    bind=True,
+    ignore_result=True,
+)
+def dedup_items(self: DatabaseTask) -> None:
+    """
+    Celery task to merge the near-duplicate items of the catalog.
+
+    Items without a MinHash signature are indexed first. Feedback of a
+    duplicate moves to its canonical item, the oldest of its group.
+    """
+    with self.db as db:
+        indexed = index_catalog(db)
+        canonical = duplicate_groups(db)
+        merge_items(db, canonical)
+        db.commit()
+    logger.info(
+        f"Indexed {indexed} items, merged {len(canonical)} duplicates into"
+        f" {len(set(canonical.values()))} items"
+    )
 
 
 @celery_app.task(
@@ -118,28 +332,12 @@ def paper_crawler(self: DatabaseTask) -> None:
     ignore_result=True,
 )
 def train_doc2vec(self: DatabaseTask) -> None:
-    # Step 1: Data Preprocessing
+    # Step 1: Data Preprocessing, a sample drawn by the database whose
+    # tokens are streamed from the cache on every epoch
     with self.db as db:
-        papers = db.exec(
-            select(Item)
-        )  # TODO: Do we need to limit the number of papers?
-        documents = [paper.abstract for paper in papers]
-
-    documents = random.sample(documents, settings.DATA_SIZE)
-
-    def preprocess(docs, tokens_only=False):
-        for i, doc in enumerate(docs):
-            # remove punctuation
-            doc = gensim.parsing.preprocessing.strip_punctuation(doc)
-            # tokenize
-            tokens = gensim.utils.simple_preprocess(doc)
-            if tokens_only:
-                yield tokens
-            else:
-                # For training data, add tags
-                yield gensim.models.doc2vec.TaggedDocument(tokens, [i])
-
-    train_corpus: list[TaggedDocument] = list(preprocess(documents))  # type: ignore
+        token_cache.sync(db)
+        ids = sample_items(db, settings.DATA_SIZE)
+    train_corpus = Corpus(token_cache, ids)
 
     # Step 2: Train the model
     model = gensim.models.doc2vec.Doc2Vec(
@@ -151,46 +349,110 @@ def train_doc2vec(self: DatabaseTask) -> None:
     )
 
     # Step 3: Evaluate the model
-    ranks = []
-    second_ranks = []
-    for doc_id in range(len(train_corpus)):
-        inferred_vector = model.infer_vector(train_corpus[doc_id].words)
-        sims = model.dv.most_similar([inferred_vector], topn=len(model.dv))
-        rank = [docid for docid, sim in sims].index(doc_id)
-        ranks.append(rank)
+    counter = evaluate(model, train_corpus, settings.DOC2VEC_EVAL_SAMPLE)
+    logger.info(f"Counter: {counter}")
 
-        second_ranks.append(sims[1])
+    # Step 4: Save the model, the vectors of every item are now stale
+    version = model_store.save(model)
+    logger.info(f"Saved doc2vec model {version}")
+    infer_doc2vec.delay()
 
-    counter = collections.Counter(ranks)
-    logger.info(f"Counter: {counter}")
 
-    # Inferring
+@celery_app.task(
+    acks_late=True,
+    base=DatabaseTask,
+    bind=True,
+    ignore_result=True,
+)
+def infer_doc2vec(self: DatabaseTask) -> None:
+    """
+    Celery task to embed items with the current doc2vec model.
+
+    Only items without a vector of the current model version, or whose
+    abstract changed since their vector was inferred, are embedded. They
+    are split into id ranges that the workers embed in parallel. It runs
+    after every crawl that stored new or changed items, and after training,
+    one planning at a time. Shards of overlapping runs skip the items the
+    others are embedding.
+    The embedding store and its index are rebuilt once every item has a
+    vector of a new model version.
+    """
+    version = model_store.current()
+    if version is None:
+        logger.info("No doc2vec model trained yet, skip inference")
+        return
     with self.db as db:
-        papers = db.exec(select(Item))
-        for paper in papers:
-            abstract = paper.abstract
-            abstract = gensim.parsing.preprocessing.strip_punctuation(abstract)
-            tokens = gensim.utils.simple_preprocess(abstract)
-            inferred_vector = model.infer_vector(tokens)
-            paper.doc2vec = inferred_vector
-            db.add(paper)
-        db.commit()
-    logger.info("Inferred vectors saved")
+        if not lock_planning(db):
+            logger.info("Inference is planned by another task, skip")
+            return
+        token_cache.sync(db)
+        shards = stale_shards(db, version, settings.EMBED_SHARD_SIZE)
+        if not shards:
+            refresh_embeddings(db, version)
+            return
+    logger.info(
+        f"Start embedding with doc2vec model {version}"
+        f" in {len(shards)} shards"
+    )
+    group(
+        infer_doc2vec_shard.s(version, first, last) for first, last in shards
+    ).apply_async()
 
 
-def byte_to_list_float(byte: bytes):
+@celery_app.task(
+    acks_late=True,
+    base=DatabaseTask,
+    bind=True,
+    ignore_result=True,
+)
+def infer_doc2vec_shard(
+    self: DatabaseTask, version: str, first: int, last: int
+) -> None:
     """
-    Converts a byte string to a list of floats.
+    Celery task to embed the stale items of an id range.
 
     Args:
-        byte (bytes): The byte string to convert.
+        version (str): The model version the shard was planned for.
+        first (int): The first item id of the shard.
+        last (int): The last item id of the shard.
+    """
+    loaded = model_store.load()
+    if loaded is None or loaded[0] != version:
+        # a newer model was trained meanwhile, its own inference follows
+        logger.info(f"Doc2vec model {version} is outdated, skip shard")
+        return
+    _, model = loaded
+    with self.db as db:
+        count = infer_stale(
+            db,
+            model,
+            version,
+            token_cache.load(),
+            settings.EMBED_BATCH_SIZE,
+            first,
+            last,
+            embedding_store,
+        )
+        logger.info(f"Embedded {count} items from {first} to {last}")
+        refresh_embeddings(db, version)
 
-    Returns:
-        list: A list of floats converted from the byte string.
+
+def refresh_embeddings(db: Session, version: str) -> None:
     """
-    import struct
+    Switch the embedding store to a model version once every item has a
+    vector of it, the last shard of an inference does it. New vectors are
+    added to the nearest-neighbour index, which is rebuilt with the store.
 
-    return list(struct.unpack("f" * (len(byte) // 4), byte))
+    Args:
+        db (Session): The database session.
+        version (str): The model version.
+    """
+    store = embedding_store.load()
+    if store.version != version and not any_stale(db, version):
+        count = store.rebuild(db, version)
+        logger.info(f"Rebuilt embedding store of {count} items for {version}")
+    indexed = vector_index.update(store)
+    logger.info(f"Indexed {indexed} item vectors")
 
 
 def train_test_split(
@@ -249,32 +511,17 @@ def train_recommender(self: DatabaseTask) -> None:
             Columns.Datetime
         ].map(lambda x: int(x.timestamp()))
 
-    with self.db as db:
-        papers = db.exec(select(Item))
-        documents = [(paper.id, paper.doc2vec) for paper in papers]
-        item_features_df = DataFrame(
-            documents, columns=[Columns.Item, "doc2vec"]
-        )
-        # Select only items that present in the feedbacks table
-        item_features_df = item_features_df[
-            item_features_df[Columns.Item].isin(
-                interactions_df[Columns.Item].unique()
-            )
-        ]
-        item_features_df["doc2vec"] = item_features_df["doc2vec"].map(
-            byte_to_list_float
-        )
-        # unpack doc2vec
-        #        id  doc2vec
-        # 0  1  [0.1, 0.2, 0.3, 0.4, 0.5]
-        # to
-        #        id  doc2vec_0  doc2vec_1  doc2vec_2  doc2vec_3  doc2vec_4
-        # 0  1         0.1         0.2         0.3         0.4         0.5
-        item_features_df = item_features_df.join(
-            other=DataFrame(
-                item_features_df['doc2vec'].apply(Series).add_prefix('doc2vec_')
-            )
-        ).drop(columns=["doc2vec"])
+    # Select only items that present in the feedbacks table
+    item_ids, vectors = embedding_store.load().get(
+        interactions_df[Columns.Item].unique()
+    )
+    # one column per dimension
+    #        id  doc2vec_0  doc2vec_1  doc2vec_2  doc2vec_3  doc2vec_4
+    # 0  1         0.1         0.2         0.3         0.4         0.5
+    item_features_df = DataFrame(vectors.astype(np.float32)).add_prefix(
+        'doc2vec_'
+    )
+    item_features_df.insert(0, Columns.Item, item_ids)
 
     # TODO(PuQing): drop the cold feedbacks
     train, test = train_test_split(
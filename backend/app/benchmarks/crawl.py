@@ -0,0 +1,152 @@
+"""
+End-to-end crawl throughput against the local fixture server.
+
+Run from ``backend/app`` with a scratch database, its crawl tables are
+emptied first::
+
+    createdb bench
+    POSTGRES_DB=bench python -m benchmarks.crawl [--papers 200]
+
+Compare sources with ``--sources``, e.g. the per-poster HTML pages of
+``ICLR`` against the paginated JSON of ``OpenReview``.
+
+``paper_crawler`` runs eagerly in this process, every source task fetches
+from ``benchmarks.fixture_server``, archives, parses and saves into
+Postgres. Reports pages/sec, items/sec, p50/p99 latency from the server
+sending a page to the commit of its items, and peak RSS.
+"""
+
+import argparse
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlmodel import Session, SQLModel, text
+
+from app import worker
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.db.engine import engine
+from app.db.init_db import upgrade_db
+from app.source.archive import PageArchive
+from app.source.base import PaperRequestsTask, RSSTask
+from app.source.cache import HttpCache
+from app.worker import paper_crawler
+from benchmarks.fixture_server import FixtureServer
+
+CRAWL_TABLES = (
+    "item",
+    "crawleditem",
+    "crawlbucket",
+    "crawlfrontier",
+    "crawlcheckpoint",
+)
+
+
+def reset_database() -> None:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        upgrade_db(session)
+        session.execute(text(f"TRUNCATE {', '.join(CRAWL_TABLES)} CASCADE"))
+        session.commit()
+
+
+def track_commits(committed: dict[str, float]) -> None:
+    """
+    Record when the items of every page and feed are committed.
+    """
+    commit_chunk = PaperRequestsTask.commit_chunk
+    rss_run = RSSTask.run
+
+    def commit(self, rows, fetched, *args):
+        result = commit_chunk(self, rows, fetched, *args)
+        now = time.monotonic()
+        for url, _ in fetched:
+            committed[url] = now
+        return result
+
+    def run(self):
+        rss_run(self)
+        committed[self.url] = time.monotonic()
+
+    PaperRequestsTask.commit_chunk = commit
+    RSSTask.run = run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--papers", type=int, default=200, help="papers per conference"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="mean response delay"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of 503s"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=1000.0, help="requests/sec per source"
+    )
+    parser.add_argument(
+        "--sources", nargs="+", help="source tasks to crawl, all by default"
+    )
+    args = parser.parse_args()
+    if not settings.POSTGRES_DB.endswith("bench"):
+        sys.exit("Set POSTGRES_DB to a scratch database named *bench")
+
+    server = FixtureServer(args.papers, args.latency, args.error_rate)
+    server.start()
+    if args.sources:
+        worker.members = [
+            (name, _class)
+            for name, _class in worker.members
+            if name in args.sources
+        ]
+    for name, _class in worker.members:
+        _class.url = server.source_urls()[name]
+
+    settings.CRAWL_RATE = args.rate
+    settings.CRAWL_BURST = max(settings.CRAWL_BURST, int(args.rate))
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.broker_url = "memory://"
+
+    reset_database()
+    workdir = tempfile.TemporaryDirectory()
+    for task in (PaperRequestsTask, RSSTask):
+        task.fetcher.cache = HttpCache(f"{workdir.name}/http")
+        task.archive = PageArchive(f"{workdir.name}/archive")
+    committed: dict[str, float] = {}
+    track_commits(committed)
+
+    start = time.monotonic()
+    paper_crawler.apply()
+    elapsed = time.monotonic() - start
+    server.shutdown()
+    workdir.cleanup()
+
+    latencies = sorted(
+        committed[url] - served
+        for url, served in server.served.items()
+        if url in committed
+    )
+    with Session(engine) as session:
+        items = session.execute(text("SELECT count(*) FROM item")).scalar()
+    quantiles = statistics.quantiles(latencies, n=100) if latencies else []
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"pages served       {len(server.served)}")
+    print(f"errors injected    {server.errors}")
+    print(f"items saved        {items}")
+    print(f"wall time          {elapsed:.1f}s")
+    print(f"pages/sec          {len(server.served) / elapsed:.1f}")
+    print(f"items/sec          {items / elapsed:.1f}")
+    if quantiles:
+        print(f"fetch-to-commit    p50 {quantiles[49]:.2f}s")
+        print(f"                   p99 {quantiles[98]:.2f}s")
+    print(f"peak RSS           {peak_rss:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
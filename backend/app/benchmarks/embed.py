@@ -0,0 +1,126 @@
+"""
+Doc2vec inference throughput over item shards.
+
+Run from ``backend/app`` with a scratch database, its items are replaced::
+
+    createdb bench
+    POSTGRES_DB=bench python -m benchmarks.embed [--items 20000]
+
+A small model is trained on synthetic abstracts and the token cache is
+built, then the catalog is embedded again for every process count, each process running
+``infer_stale`` on its own id range like ``infer_doc2vec_shard`` does in
+the workers. Reports items/sec per process count.
+"""
+
+import argparse
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from gensim.models.doc2vec import Doc2Vec, TaggedDocument
+from sqlmodel import Session, SQLModel, text
+
+from app.core.config import settings
+from app.db.embedding import infer_stale, stale_shards
+from app.db.engine import engine
+from app.db.init_db import upgrade_db
+from app.ml.doc2vec import tokenize
+from app.ml.tokens import TokenCache
+from benchmarks.fixture_server import FixtureServer
+
+
+def reset_items(n: int) -> None:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        upgrade_db(session)
+        session.execute(text("TRUNCATE item CASCADE"))
+        session.execute(
+            text(
+                "INSERT INTO item (title, abstract, from_source,"
+                " last_updated, is_hidden)"
+                " VALUES (:title, :abstract, 'bench', now(), false)"
+            ),
+            [
+                {"title": f"paper {i}", "abstract": FixtureServer.abstract(i)}
+                for i in range(n)
+            ],
+        )
+        session.commit()
+
+
+def forget_connections() -> None:
+    # forked processes must not share the pooled connections of the parent
+    engine.dispose(close=False)
+
+
+def embed_shard(
+    path: str, cache: str, version: str, first: int, last: int
+) -> int:
+    model = Doc2Vec.load(path)
+    with Session(engine) as session:
+        return infer_stale(
+            session,
+            model,
+            version,
+            TokenCache(cache).load(),
+            settings.EMBED_BATCH_SIZE,
+            first,
+            last,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument(
+        "--processes", type=int, nargs="+", default=[1, 2, 4, 8]
+    )
+    parser.add_argument("--path", default="/tmp/bench-doc2vec.model")
+    parser.add_argument("--cache", default="/tmp/bench-tokens")
+    args = parser.parse_args()
+    if not settings.POSTGRES_DB.endswith("bench"):
+        raise SystemExit("Set POSTGRES_DB to a scratch database named *bench")
+
+    reset_items(args.items)
+    corpus = [
+        TaggedDocument(tokenize(FixtureServer.abstract(i)), [i])
+        for i in range(min(args.items, 2000))
+    ]
+    Doc2Vec(corpus, vector_size=50, min_count=2, epochs=5).save(args.path)
+    shutil.rmtree(args.cache, ignore_errors=True)
+    with Session(engine) as session:
+        start = time.monotonic()
+        count = TokenCache(args.cache).sync(session)
+    elapsed = time.monotonic() - start
+    print(f"token cache  {count} items  {count / elapsed:8.1f} items/sec")
+
+    for version, processes in enumerate(args.processes):
+        # a new version makes every item stale again
+        with Session(engine) as session:
+            shards = stale_shards(
+                session, str(version), -(-args.items // processes)
+            )
+        start = time.monotonic()
+        with ProcessPoolExecutor(
+            processes, initializer=forget_connections
+        ) as pool:
+            count = sum(
+                pool.map(
+                    embed_shard,
+                    *zip(
+                        *(
+                            (args.path, args.cache, str(version), first, last)
+                            for first, last in shards
+                        )
+                    ),
+                )
+            )
+        elapsed = time.monotonic() - start
+        print(
+            f"{processes:>2} processes  {count} items"
+            f"  {count / elapsed:8.1f} items/sec"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Local HTTP server replaying every source from the fixtures.
+
+Run from ``backend/app``::
+
+    python -m benchmarks.fixture_server [--papers 200] [--latency 0.05]
+
+Each conference gets ``papers`` posters or articles per year built from
+the fixtures, with unique titles. The OpenReview api serves the same number
+of notes per venue as paginated JSON. Responses can be delayed and can fail with a
+503 at a given rate.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = Path(__file__).parent / "fixtures"
+CONFERENCES = ("nips", "iclr", "icml")
+PAPER_TITLE = "Robust Representations under Distribution Shift"
+PAPER_ABSTRACT = re.compile(
+    r"(We study the problem of learning representations that remain useful "
+    r"under distribution shift\. ?)+"
+)
+WORDS = (
+    "learning model data training graph neural network attention robust "
+    "policy agent reward language vision image text sparse kernel bound "
+    "optimization gradient convex stochastic bayesian inference causal "
+    "representation transformer diffusion generative adversarial privacy "
+    "federated fairness benchmark dataset retrieval ranking embedding"
+).split()
+DBLP_QUERY = "toc%3Adb/conf/aaai/aaai{year}.bht%3A"
+OPENREVIEW_VENUE = "ICLR.cc/{year}/Conference"
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server of the fixtures.
+
+    :param papers: papers per conference and year.
+    :param latency: mean delay of a response in seconds, exponentially
+        distributed.
+    :param error_rate: fraction of requests answered with a 503.
+    :param port: port to listen on, any free port if 0.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        papers: int = 200,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        port: int = 0,
+    ):
+        super().__init__(("127.0.0.1", port), FixtureHandler)
+        self.papers = papers
+        self.latency = latency
+        self.error_rate = error_rate
+        # monotonic time each page was last served, by url
+        self.served: dict[str, float] = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._poster = (FIXTURES / "nips_poster.html").read_text()
+        self._article = (FIXTURES / "aaai_article.html").read_text()
+        self._feeds = {
+            f"/{name}": self.with_abstracts(
+                (FIXTURES / fixture).read_text(), name
+            ).encode()
+            for name, fixture in (
+                ("arxiv/rss/cs", "arxiv_cs.xml"),
+                ("pmlr/feed.xml", "pmlr_feed.xml"),
+            )
+        }
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def source_templates(self) -> dict[str, str]:
+        """
+        Listing url template of every source task with past years.
+        """
+        templates = {
+            name.upper(): f"{self.url}/{name}/Conferences/{{year}}/Schedule"
+            "?type=Poster"
+            for name in CONFERENCES
+        }
+        templates["AAAI"] = (
+            f"{self.url}/dblp/search/publ/api?q={DBLP_QUERY}&format=xml"
+        )
+        templates["OpenReview"] = (
+            f"{self.url}/openreview/notes"
+            f"?content.venueid={OPENREVIEW_VENUE}&limit=1&count=true"
+        )
+        return templates
+
+    def source_urls(self) -> dict[str, str]:
+        """
+        Url of every source task served by the fixtures.
+        """
+        urls = {
+            name: template.format(year=2023)
+            for name, template in self.source_templates().items()
+        }
+        urls["Arxiv"] = f"{self.url}/arxiv/rss/cs"
+        urls["PMLR"] = f"{self.url}/pmlr/feed.xml"
+        return urls
+
+    @staticmethod
+    def abstract(key: str) -> str:
+        """
+        Random abstract of a paper, the same for the same key.
+        """
+        rng = random.Random(key)
+        return " ".join(rng.choices(WORDS, k=150)) + "."
+
+    def with_abstracts(self, page: str, key: str) -> str:
+        """
+        Give every abstract of a fixture its own text.
+        """
+        count = itertools.count()
+        return PAPER_ABSTRACT.sub(
+            lambda _: self.abstract(f"{key} {next(count)}"), page
+        )
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def render(self, path: str, query: str) -> bytes | None:
+        """
+        Body of a request, None if nothing is served there.
+        """
+        conference, _, rest = path.strip("/").partition("/")
+        schedule = re.fullmatch(r"Conferences/(\d{4})/Schedule", rest)
+        if conference in CONFERENCES and schedule is not None:
+            year = int(schedule.group(1))
+            event = re.search(r"showEvent=(\d+)", query)
+            if event is None:
+                return self.schedule()
+            return self.poster(conference, year, int(event.group(1)))
+        if path == "/dblp/search/publ/api":
+            params = parse_qs(query)
+            year = int(re.search(r"aaai(\d{4})", params["q"][0]).group(1))
+            return self.dblp(year, int(params["f"][0]), int(params["h"][0]))
+        if path == "/openreview/notes":
+            params = parse_qs(query)
+            return self.notes(
+                params["content.venueid"][0],
+                int(params.get("offset", ["0"])[0]),
+                int(params["limit"][0]),
+                params.get("count") == ["true"],
+            )
+        if article := re.fullmatch(r"/aaai/(\d{4})/article/view/(\d+)", path):
+            return self.article(int(article.group(1)), int(article.group(2)))
+        return self._feeds.get(path)
+
+    def schedule(self) -> bytes:
+        cards = "\n".join(
+            f'<div class="maincard narrower poster" id="maincard_{i}">'
+            f"<div class=\"maincardBody\">Poster {i}</div></div>"
+            for i in range(self.papers)
+        )
+        return f"<html><body>{cards}</body></html>".encode()
+
+    def poster(self, conference: str, year: int, event: int) -> bytes:
+        title = f"{conference.upper()} {year} poster {event}: {PAPER_TITLE}"
+        page = self._poster.replace("maincard_71234", f"maincard_{event}")
+        page = self.with_abstracts(page, title)
+        return page.replace(PAPER_TITLE, title).encode()
+
+    def article(self, year: int, article: int) -> bytes:
+        title = f"AAAI {year} article {article}: {PAPER_TITLE}"
+        page = self.with_abstracts(self._article, title)
+        return page.replace(PAPER_TITLE, title).encode()
+
+    def dblp(self, year: int, first: int, hits: int) -> bytes:
+        sent = max(0, min(hits, self.papers - first))
+        body = "".join(
+            f'<hit score="1" id="{i}"><info><title>AAAI article {i}</title>'
+            f"<ee>{self.url}/aaai/{year}/article/view/{i}</ee></info></hit>"
+            for i in range(first, first + sent)
+        )
+        return (
+            '<?xml version="1.0" encoding="US-ASCII"?><result>'
+            f'<hits total="{self.papers}" computed="{self.papers}"'
+            f' sent="{sent}" first="{first}">{body}</hits></result>'
+        ).encode()
+
+    def notes(
+        self, venue: str, offset: int, limit: int, count: bool = False
+    ) -> bytes:
+        notes = [
+            {
+                "id": f"{venue}/{i}",
+                "forum": f"{venue}/{i}",
+                "content": {
+                    "title": {"value": f"{venue} note {i}: {PAPER_TITLE}"},
+                    "abstract": {"value": self.abstract(f"{venue} {i}")},
+                    "authors": {"value": ["Ada Lovelace", "Alan Turing"]},
+                    "keywords": {"value": ["representation learning"]},
+                    "venueid": {"value": venue},
+                },
+            }
+            for i in range(offset, min(offset + limit, self.papers))
+        ]
+        # the total is only sent when the request asks for it
+        listing = {"notes": notes}
+        if count:
+            listing["count"] = self.papers
+        return json.dumps(listing).encode()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server: FixtureServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(random.expovariate(1 / self.server.latency))
+        if random.random() < self.server.error_rate:
+            with self.server._lock:
+                self.server.errors += 1
+            return self.respond(503, b"")
+
+        url = urlsplit(self.path)
+        body = self.server.render(url.path, url.query)
+        if body is None:
+            return self.respond(404, b"")
+        with self.server._lock:
+            self.server.served[self.server.url + self.path] = time.monotonic()
+        self.respond(200, body)
+
+    def respond(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--papers", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = FixtureServer(
+        args.papers, args.latency, args.error_rate, args.port
+    )
+    for name, url in server.source_urls().items():
+        print(f"{name:<8}{url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Parse throughput of the source parsers on saved pages.
+
+Run from ``backend/app``::
+
+    python -m benchmarks.parse [--seconds 2]
+
+Every case is parsed with ``app.source.selector.Page`` and, when scrapy is
+installed, with the ``scrapy.http.HtmlResponse`` the parsers used before.
+The fixtures in ``benchmarks/fixtures`` are shaped like the pages of each
+source.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import feedparser
+
+from app.source.AAAI import AAAI
+from app.source.NIPS import NIPS
+from app.source.selector import Page
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def page(url: str, body: bytes):
+    return Page(url, body)
+
+
+def scrapy_page(url: str, body: bytes):
+    from scrapy.http import HtmlResponse
+
+    return HtmlResponse(url=url, body=body, encoding="utf-8")
+
+
+def html_case(task, fixture: str) -> Callable:
+    body = (FIXTURES / fixture).read_bytes()
+
+    def run(make) -> int:
+        task.post_parse(task.parse(make("http://bench/", body)))
+        return 1
+
+    return run
+
+
+def arxiv_case(fixture: str) -> Callable:
+    # the html fragments of every entry, as ``Arxiv.post_parse`` sees them
+    entries = feedparser.parse((FIXTURES / fixture).read_bytes()).entries
+    fragments = [(entry["author"], entry["summary"]) for entry in entries]
+
+    def run(make) -> int:
+        for authors, abstract in fragments:
+            make("", authors.encode()).css("a::text").getall()
+            make("", abstract.encode()).css("p::text").get()
+        return len(fragments)
+
+    return run
+
+
+CASES = {
+    "NIPS poster": html_case(NIPS, "nips_poster.html"),
+    "AAAI article": html_case(AAAI, "aaai_article.html"),
+    "Arxiv entries": arxiv_case("arxiv_cs.xml"),
+}
+
+
+def throughput(case: Callable, make, seconds: float) -> float:
+    """
+    Pages parsed per second.
+    """
+    case(make)  # warm up
+    pages = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        pages += case(make)
+    return pages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--seconds", type=float, default=2.0, help="duration of every run"
+    )
+    args = parser.parse_args()
+
+    engines = {"Page": page}
+    try:
+        import scrapy  # noqa: F401
+
+        engines = {"HtmlResponse": scrapy_page, **engines}
+    except ImportError:
+        print("scrapy is not installed, only Page is measured")
+
+    print(f"{'case':<16}{'engine':<16}{'pages/sec':>12}{'speedup':>10}")
+    for name, case in CASES.items():
+        baseline = None
+        for engine, make in engines.items():
+            rate = throughput(case, make, args.seconds)
+            baseline = baseline or rate
+            print(
+                f"{name:<16}{engine:<16}{rate:>12.0f}{rate / baseline:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,9 @@ set -e
 
 python /app/app/pre_start.py
 
+# metrics of the pool processes, stale files would double count
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/bemore-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 celery -A app.worker worker -E -l INFO -c 4